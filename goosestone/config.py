@@ -1,9 +1,31 @@
+from typing import Optional
+
 WORLD_WIDTH: int = 3
 WORLD_HEIGHT: int = 3
 
 MAP_WIDTH: int = 20
 MAP_HEIGHT: int = 30
 
+VIEW_WIDTH: int = MAP_WIDTH  # Visible tiles, the camera scrolls on larger maps
+VIEW_HEIGHT: int = MAP_HEIGHT
+CHUNK_SIZE: int = 32  # Tiles per side of a baked background chunk
+LAZY_GENERATION: bool = True  # Generate each map when it is first visited
+WORLD_SEED: Optional[int] = None  # Fixed seed to replay a world, random if `None`
+GEN_WORKERS: int = 0  # Processes generating every map up front, 0 to disable
+GEM_COUNT: int = 7  # Gems to collect, their textures repeat after seven
+PLAN_GEMS: int = 8  # Nearest gems ordered exactly by the `m` hint, cost ~2**n
+WORLD_FILE: Optional[str] = None  # Load the world from here, or save it if missing
+RESIDENT_MAPS: int = 16  # Maps kept decoded, larger worlds page through a file
+
 FRAMERATE: int = 60
 
 TEXT_ANTIALIASING: bool = True
+TEXT_CACHE_SIZE: int = 64  # Rendered strings kept by each text cache in `render`
+BITMAP_TEXT: bool = False  # Draw HUD text with the bitmap type set
+
+DIRTY_RENDERING: bool = True  # Composite cached layers, push changed areas only
+
+HEADLESS: bool = False  # Render off-screen through SDL's dummy video driver
+HEADLESS_FRAMES: int = 600  # Frames to run before quitting in headless mode
+HEADLESS_DUMP: list[int] = []  # Frames to save as PNG in headless mode
+HEADLESS_DUMP_DIR: str = "frames"
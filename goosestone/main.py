@@ -1,48 +1,95 @@
+import os
+import time
 from random import randrange
-from typing import Literal
+from typing import Literal, Optional
 
 import maps
+import nav
 import pygame as pg
 import render
 import sprite
 import sprite.animation as ani
+import storage
 import util
 from config import (
+    DIRTY_RENDERING,
     FRAMERATE,
+    HEADLESS,
+    HEADLESS_DUMP,
+    HEADLESS_DUMP_DIR,
+    HEADLESS_FRAMES,
     MAP_HEIGHT,
     MAP_WIDTH,
-    TEXT_ANTIALIASING,
+    VIEW_HEIGHT,
+    VIEW_WIDTH,
+    WORLD_FILE,
     WORLD_HEIGHT,
     WORLD_WIDTH,
 )
 
 
 def main() -> None:
+    if HEADLESS:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
     pg.init()
-    display = pg.display.set_mode(
-        util.map_to_screen((MAP_WIDTH, MAP_HEIGHT + 2)),
-    )
-    pg.display.set_caption("GooseStone for COSC 1210")
+    if HEADLESS:  # Off-screen surface, nothing is shown
+        # Hidden throwaway window, so that surfaces take the display format
+        pg.display.set_mode((1, 1), pg.HIDDEN)
+        display = pg.Surface(
+            util.map_to_screen((VIEW_WIDTH, VIEW_HEIGHT + 2))
+        ).convert()
+    else:
+        display = pg.display.set_mode(
+            util.map_to_screen((VIEW_WIDTH, VIEW_HEIGHT + 2)),
+        )
+        pg.display.set_caption("GooseStone for COSC 1210")
     render.init()
     timer = pg.time.Clock()
-    world: maps.MapGrid = maps.MapGrid(WORLD_WIDTH, WORLD_HEIGHT, MAP_WIDTH, MAP_HEIGHT)
+    world: Optional[maps.MapGrid] = None
+    if WORLD_FILE != None and os.path.exists(WORLD_FILE):
+        try:
+            world = storage.load(
+                WORLD_FILE, shape=(WORLD_WIDTH, WORLD_HEIGHT, MAP_WIDTH, MAP_HEIGHT)
+            )
+        except ValueError as error:  # Saved under another config, start over
+            print(f"{error}, generating a new world")
+    if world == None:
+        world = maps.MapGrid(WORLD_WIDTH, WORLD_HEIGHT, MAP_WIDTH, MAP_HEIGHT)
+        if WORLD_FILE != None:
+            storage.save(world, WORLD_FILE)
     spawner: sprite.Spawner = sprite.Spawner()
+    planner: nav.Planner = nav.Planner(nav.Router(world))
     running: bool = True
     exit_reason: Literal[0, 1, 2] = 0
     gem_collected: set[str] = set()
-    spawner.add_sprite("main", sprite.TextureSprite(display, (9, 4), (3, 6), True))
+    compositor: Optional[render.Compositor] = None
+    drawn: Optional[tuple[object, ...]] = None  # View drawn on the terrain layer
+    frame: int = 0
+    started: float = time.perf_counter()
+    # Sprites draw straight to the display unless layers are composited
+    actor_surface, hud_surface = display, display
+    if DIRTY_RENDERING:
+        compositor = render.Compositor(display.get_size())
+        compositor.add_layer("terrain", static=True)
+        compositor.add_layer("props")
+        actor_surface = compositor.add_layer("actors").surface
+        hud_surface = compositor.add_layer("hud").surface
+    spawner.add_sprite(
+        "main", sprite.TextureSprite(actor_surface, (9, 4), (3, 6), True)
+    )
     spawner.add_sprite(
-        "timer", sprite.TimerSprite(display, (2, 15), (3, 9), (2, 12), world)
+        "timer", sprite.TimerSprite(actor_surface, (2, 15), (3, 9), (2, 12), world)
     )
     for gem in world.gems.items():
         idx, pos = gem
         grid_pos, map_pos = pos
         spawner.add_sprite(
-            str(idx), sprite.GemSprite(display, map_pos, idx, grid_pos, world)
+            str(idx), sprite.GemSprite(actor_surface, map_pos, idx, grid_pos, world)
         )
     spawner.add_sprite(
-        "dimension", sprite.DimensionHelperSprite((8, 32), display, False, world)
+        "dimension", sprite.DimensionHelperSprite((8, 32), hud_surface, False, world)
     )
+    spawner.add_sprite("hint", sprite.HintSprite((8, 56), hud_surface, world))
     while running:
         for e in pg.event.get():
             if e.type == pg.QUIT:
@@ -50,14 +97,43 @@ def main() -> None:
             elif e.type == pg.KEYDOWN:
                 if e.dict["key"] == pg.K_m:
                     if (target := spawner.get_sprite("main")) != None:
-                        spawner.add_animation(
-                            "random",
-                            ani.SpriteMoveTask(
-                                target,
-                                30,
-                                (randrange(MAP_WIDTH), randrange(MAP_HEIGHT)),
-                            ),
-                        )
+                        hint = planner.hint(world.focus, target.map_pos)
+                        if hint == None:  # No way to every gem, nudge around
+                            spawner.add_animation(
+                                "random",
+                                ani.SpriteMoveTask(
+                                    target,
+                                    30,
+                                    (
+                                        randrange(world.map_width),
+                                        randrange(world.map_height),
+                                    ),
+                                ),
+                            )
+                        else:  # Head for the next gem of the shortest tour
+                            if isinstance(
+                                (hint_sprite := spawner.get_sprite("hint")),
+                                sprite.HintSprite,
+                            ):
+                                hint_sprite.show(*hint)
+                            if (
+                                len(target.animations) == 0
+                                and (
+                                    path := nav.find_path(
+                                        world.focus_map(), target.map_pos, hint[1]
+                                    )
+                                )
+                                != None
+                            ):
+                                spawner.add_animation(
+                                    "mouse",
+                                    ani.PathMoveTask(
+                                        target,
+                                        nav.waypoints(path),
+                                        world,
+                                        max(FRAMERATE // 30, 1),
+                                    ),
+                                )
                 elif e.dict["key"] == pg.K_ESCAPE:
                     exit_reason = 0
                     running = False
@@ -68,19 +144,34 @@ def main() -> None:
                     ):
                         dim_sprite.toggle()
             elif e.type == pg.MOUSEBUTTONUP:
-                map_pos: tuple[int, int] = util.screen_to_map(e.dict["pos"])
+                map_pos: tuple[int, int] = util.screen_to_map(
+                    e.dict["pos"], util.camera
+                )
                 if (
-                    isinstance(
+                    e.dict["pos"][1] < VIEW_HEIGHT * render.TILE_HEIGHT  # Not the HUD
+                    and isinstance(
                         (main_sprite := spawner.get_sprite("main")),
                         sprite.TextureSprite,
                     )
                     and map_pos != main_sprite.map_pos
                     and len(main_sprite.animations) == 0
                 ):
-                    spawner.add_animation(
-                        "mouse",
-                        ani.MainMoveTask(main_sprite, FRAMERATE // 2, map_pos, world),
+                    task: ani.Task
+                    path = nav.find_path(
+                        world.focus_map(), main_sprite.map_pos, map_pos
                     )
+                    if path != None:  # Walk around mountains
+                        task = ani.PathMoveTask(
+                            main_sprite,
+                            nav.waypoints(path),
+                            world,
+                            max(FRAMERATE // 30, 1),
+                        )
+                    else:  # Unreachable, walk straight and bounce
+                        task = ani.MainMoveTask(
+                            main_sprite, FRAMERATE // 2, map_pos, world
+                        )
+                    spawner.add_animation("mouse", task)
             elif e.type == util.BOTTOMLESS_PIT:
                 exit_reason = 1
                 running = False
@@ -90,17 +181,58 @@ def main() -> None:
                     if isinstance(gem, sprite.GemSprite) and not gem.found:
                         spawner.add_animation(idx, gem.collect_animation())
                         gem_collected.add(idx)
-                        if len(gem_collected) == 7:
+                        if len(gem_collected) == len(world.gems):
                             pg.time.set_timer(util.GAME_COMPLETE, 1000, loops=1)
             elif e.type == util.GAME_COMPLETE:
                 exit_reason = 2
                 running = False
-        world.focus_map().draw(display)
+        focus_map = world.focus_map()
+        if (main_sprite := spawner.get_sprite("main")) != None:
+            util.camera.follow(
+                main_sprite.screen_pos,
+                util.map_to_screen((focus_map.width, focus_map.height)),
+            )
+        if compositor != None:
+            terrain, props, actors, hud = compositor.layers
+            # Portal jumps, scrolling and tile changes redraw the terrain
+            if (view := (world.focus, focus_map.revision, util.camera.offset)) != drawn:
+                drawn = view
+                compositor.invalidate("terrain")
+            compositor.clear()
+            if terrain.dirty:
+                terrain.surface.fill((0, 0, 0))
+                focus_map.draw_background(terrain.surface, util.camera)
+            with render.batch(props.surface, actors.surface, hud.surface):
+                rects: list[pg.Rect] = focus_map.draw_live(props.surface, util.camera)
+                rects += spawner.tick(focus_map)
+            changed = compositor.compose(display, rects)
+            if not HEADLESS:
+                pg.display.update(changed)
+        else:
+            focus_map.draw(display, util.camera)
 
-        spawner.tick()
-        pg.display.flip()
-        display.fill((0, 0, 0))
-        timer.tick(FRAMERATE)
+            with render.batch(display):
+                spawner.tick(focus_map)
+            if not HEADLESS:
+                pg.display.flip()
+        if HEADLESS:
+            if frame in HEADLESS_DUMP:
+                os.makedirs(HEADLESS_DUMP_DIR, exist_ok=True)
+                pg.image.save(
+                    display, os.path.join(HEADLESS_DUMP_DIR, f"frame_{frame:06d}.png")
+                )
+            if frame + 1 >= HEADLESS_FRAMES:
+                running = False
+            timer.tick()  # No frame cap
+        else:
+            timer.tick(FRAMERATE)
+        if compositor == None:
+            display.fill((0, 0, 0))
+        frame += 1
+    if HEADLESS:
+        elapsed = time.perf_counter() - started
+        print(f"{frame} frames in {elapsed:.3f}s ({frame / elapsed:.1f} FPS)")
+        print(f"World seed: {world.seed}")
 
     # Quit screen
     def get_time() -> tuple[int, int, int]:
@@ -110,23 +242,26 @@ def main() -> None:
             return (0, 0, 0)
 
     hour, minute, second = get_time()
+    display.fill((0, 0, 0))
     prompts: list[str] = [
         "Game will quit in 3 seconds...",
         "You fall into a bottomless pit and lose :(",
         f"You found all gems in {hour}h{minute}m{second}s and win!",
     ]
-    text: pg.Surface = pg.font.Font(None, 36).render(
-        prompts[exit_reason], TEXT_ANTIALIASING, pg.Color(255, 255, 0)
+    text: pg.Surface = render.render_label(
+        prompts[exit_reason], 36, pg.Color(255, 255, 0)
     )
     display.blit(
         text,
         (
-            (MAP_WIDTH * render.TILE_WIDTH - text.get_width()) // 2,
-            (MAP_HEIGHT * render.TILE_HEIGHT - text.get_height()) // 2,
+            (VIEW_WIDTH * render.TILE_WIDTH - text.get_width()) // 2,
+            (VIEW_HEIGHT * render.TILE_HEIGHT - text.get_height()) // 2,
         ),
     )
-    pg.display.flip()
-    pg.time.delay(3000)
+    if not HEADLESS:
+        pg.display.flip()
+        pg.time.delay(3000)
 
 
-main()
+if __name__ == "__main__":  # Pool workers must not start the game
+    main()
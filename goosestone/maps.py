@@ -1,8 +1,25 @@
 import random
+import secrets
+import tempfile
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
+from itertools import accumulate
+from typing import Iterable, Optional, Union, cast
 
+import numpy as np
 import pygame as pg
 import render
+import util
+from config import (
+    CHUNK_SIZE,
+    GEM_COUNT,
+    GEN_WORKERS,
+    LAZY_GENERATION,
+    RESIDENT_MAPS,
+    WORLD_SEED,
+)
 
 
 class TileType(Enum):
@@ -11,89 +28,720 @@ class TileType(Enum):
     PORTAL = 2
 
 
+TILE_WEIGHTS: list[int] = [45, 4, 1]  # Indexed by TileType value
+
+# Spawn keys of the independent random streams derived from a world seed
+MAP_STREAM: int = 0  # Followed by the map's (x, y) in the grid and its part
+PAIR_STREAM: int = 1
+GEM_STREAM: int = 2
+# Parts of a map's stream
+PORTAL_PART: int = 0
+TILE_PART: int = 1
+
+
 class Tile:
     """
     # Tile
 
+    A light view of one cell of a `Map`, which stores its tiles in arrays.
+
     The `variant` attribute is used to calculate following tile variants:
     - background
     - mountain
     """
 
-    tile_type: TileType
-    variant: tuple[int, int]
+    __slots__ = ("map", "location")
+
+    map: "Map"
     location: tuple[int, int]
 
-    def __init__(
-        self,
-        tile_type: TileType,
-        background: tuple[int, int],
-        location: tuple[int, int],
-    ) -> None:
-        self.tile_type = tile_type
-        self.variant = background
+    def __init__(self, map: "Map", location: tuple[int, int]) -> None:
+        self.map = map
         self.location = location
 
+    @property
+    def tile_type(self) -> TileType:
+        return TileType(int(self.map.types[self.location]))
+
+    @property
+    def variant(self) -> tuple[int, int]:
+        return unpack_variant(int(self.map.variants[self.location]))
+
+
+def pack_variant(
+    variant: Union[tuple[int, int], tuple[np.ndarray, np.ndarray]],
+) -> Union[int, np.ndarray]:
+    """
+    Pack a background variant `(x, y)` into one byte as `(x << 2) | y`, either
+    for one tile or element-wise for whole uint8 arrays.
+    """
+    return (variant[0] << 2) | variant[1]
+
+
+def unpack_variant(packed: int) -> tuple[int, int]:
+    return (packed >> 2, packed & 3)
+
+
+TileBuffer = Union[bytes, np.ndarray]  # Raw uint8 tile array, see `Map.buffers`
+
 
 class Map:
     width: int
     height: int
-    tiles: list[list[Tile]]
+    types: np.ndarray  # uint8 TileType values, indexed by [x, y]
+    variants: np.ndarray  # uint8 packed background variants, see `pack_variant`
     portals: dict[tuple[int, int], tuple[int, int]]  # Value: (portal_id,color)
+    pits: set[tuple[int, int]]  # Unpaired portals, drawn live every frame
+    chunks: dict[tuple[int, int], pg.Surface]  # Baked static layers by chunk
+    revision: int  # Bumped whenever the baked background is invalidated
+    fields: dict[frozenset[tuple[int, int]], np.ndarray]  # See `distance_field`
 
-    def gen_tiles(self) -> None:
+    def gen_tiles(
+        self,
+        rng: np.random.Generator,
+        sites: Optional[Iterable[tuple[int, int]]] = None,
+        reserved: Iterable[tuple[int, int]] = (),
+    ) -> None:
+        """
+        Draw the tile types and background variants of the whole map at once.
 
-        def choice(x: int, y: int) -> TileType:
-            if (
-                ret := random.sample(
-                    [TileType.GRASSLAND, TileType.MOUNTAIN, TileType.PORTAL],
-                    1,
-                    counts=[45, 4, 1],
-                )[0]
-            ) == TileType.PORTAL:
-                self.portals[(x, y)] = (-1, -1)
-            return ret
-
-        self.tiles = [
-            [
-                Tile(
-                    choice(x, y),
-                    (random.randrange(6), random.randrange(4)),
-                    (x, y),
+        Parameters:
+            rng (numpy.random.Generator): The random source.
+            sites (Optional[Iterable[tuple[int, int]]]): Portal locations decided
+                beforehand, or `None` to draw portals with the other tiles.
+            reserved (Iterable[tuple[int, int]]): Locations forced to grassland.
+
+        Returns:
+            None: Nothing to return.
+        """
+
+        shape = (self.width, self.height)
+        self.types = gen_tile_types(self.width, self.height, rng, sites)
+        self.variants = np.asarray(
+            pack_variant(
+                (
+                    rng.integers(6, size=shape, dtype=np.uint8),
+                    rng.integers(4, size=shape, dtype=np.uint8),
                 )
-                for y in range(self.height)
-            ]
-            for x in range(self.width)
-        ]
+            )
+        )
+        for loc in reserved:
+            self.types[loc] = TileType.GRASSLAND.value
+        self.find_portals(sites)
 
-    def __init__(self, width: int, height: int) -> None:
+    def load_tiles(
+        self,
+        types: TileBuffer,
+        variants: TileBuffer,
+        reserved: Iterable[tuple[int, int]] = (),
+        sites: Optional[Iterable[tuple[int, int]]] = None,
+    ) -> None:
+        """
+        Take the tiles from raw arrays made by `buffers`. Writable buffers, such
+        as a copy-on-write `mmap`, are used in place.
+
+        Parameters:
+            types (TileBuffer): The tile types.
+            variants (TileBuffer): The packed background variants.
+            reserved (Iterable[tuple[int, int]]): Locations forced to grassland.
+            sites (Optional[Iterable[tuple[int, int]]]): Where the portals were
+                generated, or `None` to look for them in the tiles.
+
+        Returns:
+            None: Nothing to return.
+        """
+
+        shape = (self.width, self.height)
+        self.types = np.frombuffer(types, np.uint8).reshape(shape)
+        self.variants = np.frombuffer(variants, np.uint8).reshape(shape)
+        if not self.types.flags.writeable:
+            self.types = self.types.copy()
+        if not self.variants.flags.writeable:
+            self.variants = self.variants.copy()
+        for loc in reserved:
+            self.types[loc] = TileType.GRASSLAND.value
+        self.find_portals(sites)
+
+    def buffers(self) -> tuple[bytes, bytes]:
+        """
+        Get the tile types and packed variants as raw bytes.
+        """
+        return self.types.tobytes(), self.variants.tobytes()
+
+    def find_portals(self, sites: Optional[Iterable[tuple[int, int]]] = None) -> None:
+        """
+        Register every portal tile as an unpaired portal. Known `sites` are only
+        checked against the tiles instead of scanning the whole map.
+        """
+
+        if sites == None:
+            found = np.argwhere(self.types == TileType.PORTAL.value)
+        else:
+            found = np.array(list(sites), np.intp).reshape(-1, 2)
+            found = found[self.types[found[:, 0], found[:, 1]] == TileType.PORTAL.value]
+        locations = [(x, y) for x, y in found.tolist()]
+        self.portals.update(dict.fromkeys(locations, (-1, -1)))
+        self.pits.update(locations)
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        rng: Optional[np.random.Generator] = None,
+        sites: Optional[Iterable[tuple[int, int]]] = None,
+        reserved: Iterable[tuple[int, int]] = (),
+        buffers: Optional[tuple[TileBuffer, TileBuffer]] = None,
+    ) -> None:
         self.width = width
         self.height = height
         self.portals = {}
-        self.gen_tiles()
+        self.pits = set()
+        self.chunks = {}
+        self.revision = 0
+        self.fields = {}
+        if buffers != None:
+            self.load_tiles(*buffers, reserved, sites)
+        else:
+            rng = rng if rng != None else np.random.default_rng()
+            self.gen_tiles(rng, sites, reserved)
         pass
 
-    def draw(self, surface: pg.Surface) -> None:
-        tiles: list[Tile] = list((tile for row in self.tiles for tile in row))
-        for tile in tiles:
-            render.draw_tile(surface, tile.variant, tile.location)
-        for tile in tiles:
-            if tile.tile_type == TileType.MOUNTAIN:
-                a, b = tile.variant
-                variant = (a * b) % 5  # Five mountain variants
-                render.draw_tile_2h(surface, (variant, 4), tile.location)
-            elif tile.tile_type == TileType.PORTAL:
-                loc = tile.location
-                color = self.portals[loc][1]
-                if color == -1:
-                    color = random_portal_color()
-                render.draw_tile(surface, (5, color), loc)
+    def tile(self, location: tuple[int, int]) -> Tile:
+        return Tile(self, location)
+
+    def set_tile_type(self, location: tuple[int, int], tile_type: TileType) -> None:
+        """
+        Change the type of a tile and invalidate the baked background around it.
+
+        Parameters:
+            location (tuple[int, int]): The tile's position in (x, y).
+            tile_type (TileType): The new type of the tile.
+
+        Returns:
+            None: Nothing to return.
+        """
+
+        self.types[location] = tile_type.value
+        if tile_type == TileType.PORTAL:
+            self.set_portal(location, self.portals.get(location, (-1, -1)))
+        else:
+            self.portals.pop(location, None)
+            self.pits.discard(location)
+            self.invalidate(location)
+
+    def set_portal(self, location: tuple[int, int], info: tuple[int, int]) -> None:
+        """
+        Assign `(portal_id, color)` to a portal and invalidate the baked background
+        around it.
+        """
+
+        self.portals[location] = info
+        if info[1] == -1:
+            self.pits.add(location)
+        else:
+            self.pits.discard(location)
+        self.invalidate(location)
+
+    def set_portals(self, infos: dict[tuple[int, int], tuple[int, int]]) -> None:
+        """
+        Assign `(portal_id, color)` to many portals, invalidating the baked
+        background once.
+        """
+
+        for location, info in infos.items():
+            self.portals[location] = info
+            if info[1] == -1:
+                self.pits.add(location)
+            else:
+                self.pits.discard(location)
+        if len(infos) > 0:
+            self.invalidate()
+
+    def invalidate(self, location: Optional[tuple[int, int]] = None) -> None:
+        """
+        Drop the baked chunk containing `location`, or every chunk if `None`.
+        """
+
+        self.revision += 1
+        self.fields.clear()
+        if location == None:
+            self.chunks.clear()
+            return
+        x, y = location[0] // CHUNK_SIZE, location[1] // CHUNK_SIZE
+        self.chunks.pop((x, y), None)
+        if location[1] % CHUNK_SIZE == 0:  # Mountains overlap the chunk above
+            self.chunks.pop((x, y - 1), None)
+
+    def bake(self, chunk: tuple[int, int]) -> pg.Surface:
+        """
+        Compile the ground, mountains and paired portals of a chunk into an
+        off-screen surface. Unpaired portals keep flickering, so they are drawn
+        live.
+
+        Parameters:
+            chunk (tuple[int, int]): The chunk's position in (x, y).
+
+        Returns:
+            pygame.Surface: The baked chunk.
+        """
+
+        x0, y0 = chunk[0] * CHUNK_SIZE, chunk[1] * CHUNK_SIZE
+        x1 = min(x0 + CHUNK_SIZE, self.width)
+        y1 = min(y0 + CHUNK_SIZE, self.height)
+        background = pg.Surface(util.map_to_screen((x1 - x0, y1 - y0)))
+        if cast(Optional[pg.Surface], pg.display.get_surface()) != None:
+            background = background.convert()
+        # The first row of the next chunk still overlaps this one
+        types = self.types[x0:x1, y0 : min(y1 + 1, self.height)]
+        variants = self.variants[x0:x1, y0 : min(y1 + 1, self.height)]
+        mountains = ((variants >> 2) * (variants & 3)) % 5
+        with render.batch(background):
+            for (x, y), packed in np.ndenumerate(variants[:, : y1 - y0]):
+                render.draw_tile(background, unpack_variant(int(packed)), (x, y))
+            for x, y in np.argwhere(types != TileType.GRASSLAND.value).tolist():
+                if types[x, y] == TileType.MOUNTAIN.value:
+                    texture = (int(mountains[x, y]), 4)
+                    render.draw_tile_2h(background, texture, (x, y))
+                elif y < y1 - y0:
+                    color = self.portals[(x + x0, y + y0)][1]
+                    if color != -1:
+                        render.draw_tile(background, (5, color), (x, y))
+        self.chunks[chunk] = background
+        return background
+
+    def mountain_texture(self, tile: Tile) -> tuple[int, int]:
+        a, b = tile.variant
+        variant = (a * b) % 5  # Five mountain variants
+        return (variant, 4)
+
+    def occluders(self, area: pg.Rect) -> list[Tile]:
+        """
+        Find the mountains whose double-height texture overlaps an area.
+
+        Parameters:
+            area (pygame.Rect): The area in map pixels.
+
+        Returns:
+            list[Tile]: The mountain tiles.
+        """
+
+        x0 = max(area.left // render.TILE_WIDTH, 0)
+        x1 = min((area.right - 1) // render.TILE_WIDTH, self.width - 1)
+        y0 = max(area.top // render.TILE_HEIGHT, 0)
+        # Mountains reach one row up, so look one row further down
+        y1 = min((area.bottom - 1) // render.TILE_HEIGHT + 1, self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return []
+        found = self.types[x0 : x1 + 1, y0 : y1 + 1] == TileType.MOUNTAIN.value
+        return [Tile(self, (x + x0, y + y0)) for x, y in np.argwhere(found).tolist()]
+
+    def landings(self, portals: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        """
+        Pick the tiles to land on when arriving through portals: for each, the
+        first grassland tile to the left, right, top or bottom, else the portal
+        itself.
+        """
+
+        return find_landings(self.types, portals)
+
+    def distance_field(self, targets: Iterable[tuple[int, int]]) -> np.ndarray:
+        """
+        Get the walking distance from every tile to the nearest of a set of
+        targets, as in `nav.reach`: walking only across grassland, but stepping
+        onto the target tiles whatever their type. Fields are shared per target
+        set until the map changes, so lookups are plain array indexing.
+
+        Parameters:
+            targets (Iterable[tuple[int, int]]): The tiles to walk to.
+
+        Returns:
+            numpy.ndarray: Read-only int32 steps indexed by [x, y], -1 where no
+                target can be reached.
+        """
+
+        key = frozenset(targets)
+        if (field := self.fields.get(key)) is not None:  # Arrays compare by element
+            return field
+        field = walk_field(self.types, key)
+        field.flags.writeable = False
+        self.fields[key] = field
+        return field
+
+    def distance(
+        self, location: tuple[int, int], targets: Iterable[tuple[int, int]]
+    ) -> Optional[int]:
+        """
+        Get the walking distance from a tile to the nearest target, or `None` if
+        none can be reached. See `distance_field`.
+        """
+
+        steps = int(self.distance_field(targets)[location])
+        return steps if steps >= 0 else None
+
+    def step_toward(
+        self, location: tuple[int, int], targets: Iterable[tuple[int, int]]
+    ) -> Optional[tuple[int, int]]:
+        """
+        Get the neighbouring tile one step closer to the nearest target, or
+        `None` if `location` is a target or none can be reached.
+        """
+
+        field = self.distance_field(targets)
+        steps = field[location]
+        if steps <= 0:
+            return None
+        x, y = location
+        for a, b in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]:
+            if (
+                0 <= a < self.width
+                and 0 <= b < self.height
+                and field[a, b] == steps - 1
+            ):
+                return (a, b)
+        return None
+
+    def draw_occluder(
+        self, surface: pg.Surface, tile: Tile, camera: util.Camera
+    ) -> pg.Rect:
+        x, y = util.map_to_screen(tile.location, camera)
+        with render.clip(surface, camera.view()):
+            return render.draw_tile_2h_custom(
+                surface, self.mountain_texture(tile), (x, y - render.TILE_HEIGHT)
+            )
+
+    def draw(self, surface: pg.Surface, camera: util.Camera) -> None:
+        self.draw_background(surface, camera)
+        self.draw_live(surface, camera)
+
+    def draw_background(self, surface: pg.Surface, camera: util.Camera) -> None:
+        """
+        Blit the baked chunks visible through `camera`, baking missing ones.
+        Chunks are cut at the edges of the view.
+        """
+
+        columns, rows = camera.visible(CHUNK_SIZE)
+        size = util.map_to_screen((CHUNK_SIZE, CHUNK_SIZE))
+        last_column = (self.width - 1) // CHUNK_SIZE
+        last_row = (self.height - 1) // CHUNK_SIZE
+        with render.clip(surface, camera.view()):
+            for x in range(columns.start, min(columns.stop, last_column + 1)):
+                for y in range(rows.start, min(rows.stop, last_row + 1)):
+                    chunk = self.chunks.get((x, y))
+                    if chunk == None:
+                        chunk = self.bake((x, y))
+                    surface.blit(
+                        chunk,
+                        (
+                            x * size[0] - camera.offset[0],
+                            y * size[1] - camera.offset[1],
+                        ),
+                    )
+
+    def draw_live(self, surface: pg.Surface, camera: util.Camera) -> list[pg.Rect]:
+        """
+        Draw the visible parts of the map that change every frame.
+
+        Parameters:
+            surface (pygame.Surface): The target surface.
+            camera (util.Camera): The viewport.
+
+        Returns:
+            list[pygame.Rect]: Areas of `surface` that have been changed.
+        """
+
+        columns, rows = camera.visible()
+        rects: list[pg.Rect] = []
+        with render.clip(surface, camera.view()):
+            for loc in self.pits:  # Bottomless pits flicker every frame
+                x, y = loc
+                if x not in columns or y not in rows:
+                    continue
+                dest = util.map_to_screen(loc, camera)
+                rects.append(
+                    render.draw_tile_custom(surface, (5, random_portal_color()), dest)
+                )
+                if (
+                    y + 1 < self.height
+                    and self.types[x, y + 1] == TileType.MOUNTAIN.value
+                ):  # Keep the overlap order
+                    below = self.mountain_texture(self.tile((x, y + 1)))
+                    render.draw_tile_2h_custom(surface, below, dest)
+        return rects
+
+
+def gen_portal_sites(
+    width: int, height: int, rng: np.random.Generator
+) -> list[tuple[int, int]]:
+    """
+    Pick the portal locations of a map with the portal tile weight, without
+    generating the rest of its tiles.
+
+    Parameters:
+        width (int): Width of the map.
+        height (int): Height of the map.
+        rng (numpy.random.Generator): The random source.
+
+    Returns:
+        list[tuple[int, int]]: The portal locations.
+    """
+
+    draws = rng.integers(sum(TILE_WEIGHTS), size=(width, height))
+    found = draws < TILE_WEIGHTS[TileType.PORTAL.value]
+    return [(x, y) for x, y in np.argwhere(found).tolist()]
+
+
+def find_landings(
+    types: np.ndarray, portals: list[tuple[int, int]]
+) -> list[tuple[int, int]]:
+    """
+    Pick the landing tiles of portals on a map, see `Map.landings`.
+
+    Parameters:
+        types (numpy.ndarray): The tile types indexed by `[x, y]`.
+        portals (list[tuple[int, int]]): The portal locations.
+
+    Returns:
+        list[tuple[int, int]]: The landing tile of each portal.
+    """
+
+    width, height = types.shape
+    found = np.array(portals, np.intp).reshape(-1, 2)
+    result = found.copy()
+    pending = np.ones(len(found), np.bool_)
+    for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        xs, ys = found[:, 0] + dx, found[:, 1] + dy
+        ok = pending & (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        ok[ok] = types[xs[ok], ys[ok]] == TileType.GRASSLAND.value
+        result[ok, 0], result[ok, 1] = xs[ok], ys[ok]
+        pending &= ~ok
+    return [(x, y) for x, y in result.tolist()]
+
+
+def walk_field(types: np.ndarray, targets: Iterable[tuple[int, int]]) -> np.ndarray:
+    """
+    Compute the walking distance from every tile of a map to the nearest of a
+    set of targets, see `Map.distance_field`.
+
+    Parameters:
+        types (numpy.ndarray): The tile types indexed by `[x, y]`.
+        targets (Iterable[tuple[int, int]]): The tiles to walk to.
+
+    Returns:
+        numpy.ndarray: int32 steps indexed by [x, y], -1 where no target can be
+            reached.
+    """
+
+    field = np.full(types.shape, -1, np.int32)
+    walkable = types == TileType.GRASSLAND.value
+    frontier = np.zeros_like(walkable)
+    if len(found := list(targets)) > 0:
+        frontier[tuple(np.array(found).T)] = True
+    field[frontier] = 0
+    walkable &= ~frontier
+    steps = 0
+    # Grow the whole wavefront one step per pass
+    while frontier.any():
+        steps += 1
+        grown = np.zeros_like(frontier)
+        grown[1:] |= frontier[:-1]
+        grown[:-1] |= frontier[1:]
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        frontier = grown & walkable
+        walkable &= ~frontier
+        field[frontier] = steps
+    return field
+
+
+def gen_tile_types(
+    width: int,
+    height: int,
+    rng: np.random.Generator,
+    sites: Optional[Iterable[tuple[int, int]]] = None,
+) -> np.ndarray:
+    """
+    Draw the tile types of a map, the first draw of its tile stream, without
+    its background variants.
+
+    Parameters:
+        width (int): Width of the map.
+        height (int): Height of the map.
+        rng (numpy.random.Generator): The random source.
+        sites (Optional[Iterable[tuple[int, int]]]): Portal locations decided
+            beforehand, or `None` to draw portals with the other tiles.
+
+    Returns:
+        numpy.ndarray: uint8 array of the tile types indexed by `[x, y]`.
+    """
+
+    weights = TILE_WEIGHTS if sites == None else TILE_WEIGHTS[: TileType.PORTAL.value]
+    # Map uniform draws onto the weighted tile types
+    types = np.searchsorted(
+        np.cumsum(weights), rng.integers(sum(weights), size=(width, height)), "right"
+    ).astype(np.uint8)
+    for loc in sites if sites != None else ():
+        types[loc] = TileType.PORTAL.value
+    return types
+
+
+class PortalPool:
+    """
+    # PortalPool
+
+    The maps that still have unpaired portals. Maps are kept in an array with a
+    position index and removed by swapping with the last one, so adding, taking
+    and picking at random are all O(1).
+    """
+
+    coords: list[tuple[int, int]]
+    index: dict[tuple[int, int], int]  # Position of each map in `coords`
+    portals: dict[tuple[int, int], list[tuple[int, int]]]
+
+    def __init__(self) -> None:
+        self.coords = []
+        self.index = {}
+        self.portals = {}
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def add(self, coord: tuple[int, int], portals: list[tuple[int, int]]) -> None:
+        """
+        Add the unpaired portals of a map. Maps without any are left out.
+        """
+
+        if len(portals) == 0:
+            return
+        self.index[coord] = len(self.coords)
+        self.coords.append(coord)
+        self.portals[coord] = portals
+
+    def take(self, coord: tuple[int, int]) -> tuple[int, int]:
+        """
+        Take a portal of a map, dropping the map when it runs out.
+        """
+
+        portals = self.portals[coord]
+        portal = portals.pop()
+        if len(portals) == 0:
+            last = self.coords.pop()
+            position = self.index.pop(coord)
+            if last != coord:
+                self.coords[position] = last
+                self.index[last] = position
+            del self.portals[coord]
+        return portal
+
+    def choice(self, rng: random.Random) -> tuple[int, int]:
+        return self.coords[rng.randrange(len(self.coords))]
+
+    def choice_pair(
+        self, rng: random.Random
+    ) -> tuple[tuple[int, int], tuple[int, int]]:
+        """
+        Pick two different maps at random.
+        """
+
+        a = rng.randrange(len(self.coords))
+        b = rng.randrange(len(self.coords) - 1)
+        if b >= a:
+            b += 1
+        return self.coords[a], self.coords[b]
+
+
+def sample_indices(rng: random.Random, population: int, count: int) -> list[int]:
+    """
+    Pick `count` distinct integers below `population` with Floyd's algorithm, in
+    O(count) time whatever the population.
+
+    Parameters:
+        rng (random.Random): The random source.
+        population (int): Upper bound of the integers.
+        count (int): How many to pick.
+
+    Returns:
+        list[int]: The picked integers.
+    """
+
+    if count > population:
+        raise ValueError(f"Cannot pick {count} of {population} cells")
+    picked: set[int] = set()
+    order: list[int] = []
+    for j in range(population - count, population):
+        if (index := rng.randrange(j + 1)) in picked:
+            index = j
+        picked.add(index)
+        order.append(index)
+    return order
+
+
+def map_stream(seed: int, grid_pos: tuple[int, int], part: int) -> np.random.Generator:
+    """
+    Get one independent part of the stream of a map in a world seeded with
+    `seed`, `PORTAL_PART` or `TILE_PART`. Only the asked part is derived.
+    """
+
+    return np.random.default_rng(
+        np.random.SeedSequence(seed, spawn_key=(MAP_STREAM, *grid_pos, part))
+    )
+
+
+def gen_map_data(
+    seed: int, grid_pos: tuple[int, int], width: int, height: int
+) -> tuple[list[tuple[int, int]], bytes, bytes]:
+    """
+    Generate one map of a world in a worker process.
+
+    Parameters:
+        seed (int): The world seed.
+        grid_pos (tuple[int, int]): The map's position in the grid.
+        width (int): Width of the map.
+        height (int): Height of the map.
+
+    Returns:
+        tuple[list[tuple[int, int]], bytes, bytes]: The portal locations, the
+            tile types and the packed variants, see `Map.buffers`.
+    """
+
+    sites = gen_portal_sites(width, height, map_stream(seed, grid_pos, PORTAL_PART))
+    tile = map_stream(seed, grid_pos, TILE_PART)
+    return (sites, *Map(width, height, tile, sites).buffers())
 
 
 class MapGrid:
+    """
+    # MapGrid
+
+    Portals, their pairs and gems are decided for the whole grid up front, gems
+    on grassland found by drawing only the tile types of each map. In lazy
+    mode, the tiles of each map are generated from its seed when the map is
+    first touched, with the portals placed where they were decided.
+
+    Every map, the portal pairing and every gem draw from their own stream
+    derived from `seed`, so the same seed always gives the same world and any
+    part of it can be regenerated alone. With `workers`, every map is generated
+    up front in a process pool, and only portals and gems are placed here.
+
+    When the grid holds more maps than `capacity`, tiles are paged through a
+    memory-mapped file and only the most recently used maps stay decoded. This
+    bounds the decoded tiles only: the portal sites, links, pairs, gems and
+    destinations of the whole world stay in memory and grow with it.
+    """
+
     width: int
     height: int
-    maps: list[list[Map]]
+    map_width: int
+    map_height: int
+    seed: int
+    maps: list[list[Optional[Map]]]  # `None` until generated
+    tiles: Optional[np.ndarray]  # Stored maps by [x, y, types/variants], see `storage`
+    stored: Optional[np.ndarray]  # Whether each map is in `tiles` yet
+    revisions: Optional[np.ndarray]  # `Map.revision` of each map when dropped
+    resident: OrderedDict[tuple[int, int], Map]  # Decoded maps, least recent first
+    capacity: int  # Most maps kept in `resident`, 0 for no limit
+    sites: dict[tuple[int, int], list[tuple[int, int]]]  # Portal locations by map
+    reserved: dict[tuple[int, int], set[tuple[int, int]]]  # Forced grassland
+    links: dict[tuple[int, int], dict[tuple[int, int], tuple[int, int]]]
     focus: tuple[int, int]
     pairs: dict[
         int,
@@ -103,22 +751,79 @@ class MapGrid:
         ],
     ]
     gems: dict[int, tuple[tuple[int, int], tuple[int, int]]]
+    gem_index: dict[tuple[tuple[int, int], tuple[int, int]], int]  # Uncollected
+    # (grid_pos, portal) -> (dest_grid, landing), filled as destinations generate
+    destinations: dict[
+        tuple[tuple[int, int], tuple[int, int]],
+        tuple[tuple[int, int], tuple[int, int]],
+    ]
 
     def __init__(
-        self, grid_width: int, grid_height: int, map_width: int, map_height: int
+        self,
+        grid_width: int,
+        grid_height: int,
+        map_width: int,
+        map_height: int,
+        lazy: bool = LAZY_GENERATION,
+        seed: Optional[int] = WORLD_SEED,
+        workers: int = GEN_WORKERS,
+        gem_count: int = GEM_COUNT,
+        capacity: int = RESIDENT_MAPS,
     ) -> None:
         self.width = grid_width
         self.height = grid_height
-        self.maps = [
-            [Map(map_width, map_height) for _ in range(grid_height)]
-            for _ in range(grid_width)
-        ]
-        for x, y in [(3, 6), (3, 9)]:
-            self.maps[0][0].tiles[x][y].tile_type = TileType.GRASSLAND
-            self.maps[0][0].portals.pop((x, y), (0, 0))
+        self.map_width = map_width
+        self.map_height = map_height
+        self.seed = seed if seed != None else secrets.randbits(128)
+        self.maps = [[None] * grid_height for _ in range(grid_width)]
+        self.tiles = None
+        self.stored = None
+        self.revisions = None
+        self.resident = OrderedDict()
+        self.capacity = capacity
+        if 0 < capacity < grid_width * grid_height:
+            self.tiles = np.memmap(
+                tempfile.TemporaryFile(),
+                np.uint8,
+                "w+",
+                shape=(grid_width, grid_height, 2, map_width, map_height),
+            )
+            self.stored = np.zeros((grid_width, grid_height), np.bool_)
+            self.revisions = np.zeros((grid_width, grid_height), np.int64)
+        coords = [(x, y) for x in range(grid_width) for y in range(grid_height)]
+        generated: dict[tuple[int, int], tuple[bytes, bytes]] = {}
+        if workers > 0:
+            with ProcessPoolExecutor(workers) as pool:
+                results = pool.map(
+                    gen_map_data,
+                    [self.seed] * len(coords),
+                    coords,
+                    [map_width] * len(coords),
+                    [map_height] * len(coords),
+                    chunksize=max(len(coords) // (workers * 4), 1),
+                )
+                self.sites = {}
+                for coord, (sites, types, variants) in zip(coords, results):
+                    self.sites[coord] = sites
+                    generated[coord] = (types, variants)
+        else:
+            self.sites = {
+                coord: gen_portal_sites(
+                    map_width, map_height, self.map_stream(coord, PORTAL_PART)
+                )
+                for coord in coords
+            }
+        self.reserved = {(0, 0): set()}
+        self.links = {coord: {} for coord in coords}
+        for loc in [(3, 6), (3, 9)]:
+            if loc in self.sites[(0, 0)]:
+                self.sites[(0, 0)].remove(loc)
+            self.reserved[(0, 0)].add(loc)
         self.focus = (0, 0)
 
         # Portal pairs gen START
+        rng = self.rng(PAIR_STREAM)
+
         def helper():
             inner: int = 0
             while True:
@@ -134,80 +839,278 @@ class MapGrid:
                 tuple[tuple[int, int], tuple[int, int]],
             ],
         ] = {}
-        world_portals = {
-            (x, y): list(self.maps[x][y].portals.keys())
-            for x in range(grid_width)
-            for y in range(grid_height)
-        }
+        world_portals = {coord: list(sites) for coord, sites in self.sites.items()}
         grid_coords = list(world_portals.keys())
         grid_coords.remove((0, 0))
-        random.shuffle(grid_coords)
-        remaining: dict[tuple[int, int], list[tuple[int, int]]] = {}
+        rng.shuffle(grid_coords)
+        remaining = PortalPool()
 
         def new(target: tuple[int, int]) -> None:
-            remaining[target] = world_portals.pop(target)
-
-        def check(target: tuple[int, int]) -> None:
-            if len(remaining[target]) == 0:
-                del remaining[target]
+            remaining.add(target, world_portals.pop(target))
 
         def pair(a: tuple[int, int], b: tuple[int, int]) -> None:
             portal_id = next(portal_id_counter)
-            color = random_portal_color()
-            a_full = (a, remaining[a].pop())
-            b_full = (b, remaining[b].pop())
-            self.maps[a[0]][a[1]].portals[a_full[1]] = (portal_id, color)
-            self.maps[b[0]][b[1]].portals[b_full[1]] = (portal_id, color)
+            color = random_portal_color(rng)
+            a_full = (a, remaining.take(a))
+            b_full = (b, remaining.take(b))
+            self.links[a][a_full[1]] = (portal_id, color)
+            self.links[b][b_full[1]] = (portal_id, color)
             pairs[portal_id] = (a_full, b_full)
-            check(a)
-            check(b)
 
         new((0, 0))
         for coord in grid_coords:  # Ensure full connectivity
-            parent = random.sample(remaining.keys(), 1)[0]
+            if len(remaining) == 0 or len(world_portals[coord]) == 0:
+                raise ValueError(f"Dimension {coord} cannot be connected")
+            parent = remaining.choice(rng)
             new(coord)
             pair(parent, coord)
         while len(remaining) > 1:  # Extra portals
-            a, b = random.sample(remaining.keys(), 2)
+            a, b = remaining.choice_pair(rng)
             pair(a, b)
         # Portal pairs gen END
         self.pairs = pairs
         # Gems gen START
         gems: dict[int, tuple[tuple[int, int], tuple[int, int]]] = {}
-        for i in range(7):
 
-            def gen_pos() -> tuple[tuple[int, int], tuple[int, int], bool]:
-                grid_pos_x = random.randrange(grid_width)
-                grid_pos_y = random.randrange(grid_height)
-                map_pos_x = random.randrange(map_width)
-                map_pos_y = random.randrange(map_height)
-                if (
-                    self.maps[grid_pos_x][grid_pos_y]
-                    .tiles[map_pos_x][map_pos_y]
-                    .tile_type
-                    == TileType.GRASSLAND
-                ) and (
-                    ((grid_pos_x, grid_pos_y), (map_pos_x, map_pos_y))
-                    not in gems.values()
-                ):
-                    return ((grid_pos_x, grid_pos_y), (map_pos_x, map_pos_y), True)
-                else:
-                    return ((0, 0), (0, 0), False)
-
-            while not (result := gen_pos())[2]:
-                pass
-            grid_pos, map_pos, _ = result
-            gems[i] = (grid_pos, map_pos)
+        def terrain(coord: tuple[int, int]) -> np.ndarray:
+            types: np.ndarray
+            if coord in generated:  # Copied out of the read-only bytes
+                types = np.frombuffer(generated[coord][0], np.uint8).reshape(
+                    map_width, map_height
+                )
+                types = types.copy()
+            else:  # Only the tile types are drawn, see `gen_tiles`
+                types = gen_tile_types(
+                    map_width,
+                    map_height,
+                    self.map_stream(coord, TILE_PART),
+                    self.sites[coord],
+                )
+            for loc in self.reserved.get(coord, ()):
+                types[loc] = TileType.GRASSLAND.value
+            return types
+
+        # Gems lie on grassland. Maps are picked by their share of it, then
+        # cells within the grassland that can be walked to from where paired
+        # portals land.
+        ends = list(
+            accumulate(
+                int(np.count_nonzero(terrain(c) == TileType.GRASSLAND.value))
+                for c in coords
+            )
+        )
+        rng = self.rng(GEM_STREAM)
+        picked: dict[int, list[int]] = {}  # Gem indices by map
+        for i, index in enumerate(sample_indices(rng, ends[-1], gem_count)):
+            picked.setdefault(bisect_right(ends, index), []).append(i)
+        for m, indices in picked.items():
+            grid_pos = coords[m]
+            types = terrain(grid_pos)
+            grass = types == TileType.GRASSLAND.value
+            sources = find_landings(types, list(self.links[grid_pos]))
+            sources += self.reserved.get(grid_pos, ())
+            near = grass & (walk_field(types, sources) >= 0)
+            # Walled in grassland only takes gems that fit nowhere else
+            cells = np.flatnonzero(
+                near if np.count_nonzero(near) >= len(indices) else grass
+            )
+            for i, cell in zip(indices, sample_indices(rng, len(cells), len(indices))):
+                gems[i] = (grid_pos, divmod(int(cells[cell]), map_height))
+        gems = dict(sorted(gems.items()))
         # Gems gen END
         self.gems = gems
+        self.gem_index = {pos: idx for idx, pos in gems.items()}
+        self.destinations = {}
+        for coord, buffers in generated.items():
+            self.get_map(coord, buffers)
+        if not lazy:
+            for coord in coords:
+                self.get_map(coord)
+
+    @classmethod
+    def assemble(
+        cls,
+        seed: int,
+        tiles: np.ndarray,
+        pairs: dict[
+            int,
+            tuple[
+                tuple[tuple[int, int], tuple[int, int]],
+                tuple[tuple[int, int], tuple[int, int]],
+            ],
+        ],
+        colors: dict[int, int],
+        gems: dict[int, tuple[tuple[int, int], tuple[int, int]]],
+        destinations: dict[
+            tuple[tuple[int, int], tuple[int, int]],
+            tuple[tuple[int, int], tuple[int, int]],
+        ],
+    ) -> "MapGrid":
+        """
+        Rebuild a world from its stored parts without generating anything. Maps
+        are built from `tiles` when first touched.
+
+        Parameters:
+            seed (int): The world seed.
+            tiles (numpy.ndarray): uint8 array of shape `(grid_width,
+                grid_height, 2, map_width, map_height)` with the tile types and
+                packed variants of every map.
+            pairs (dict): Portal pairs by portal id.
+            colors (dict[int, int]): Portal colors by portal id.
+            gems (dict): Gem locations by gem index.
+            destinations (dict): The portal destination table.
+
+        Returns:
+            MapGrid: The world.
+        """
+
+        world = cls.__new__(cls)
+        world.width, world.height, _, world.map_width, world.map_height = tiles.shape
+        world.seed = seed
+        world.maps = [[None] * world.height for _ in range(world.width)]
+        world.tiles = tiles
+        world.stored = np.ones(tiles.shape[:2], np.bool_)
+        world.revisions = np.zeros(tiles.shape[:2], np.int64)
+        world.resident = OrderedDict()
+        world.capacity = RESIDENT_MAPS
+        world.sites = {}
+        world.reserved = {}
+        world.links = {
+            (x, y): {} for x in range(world.width) for y in range(world.height)
+        }
+        for portal_id, ends in pairs.items():
+            for grid_pos, loc in ends:
+                world.links[grid_pos][loc] = (portal_id, colors[portal_id])
+        world.focus = (0, 0)
+        world.pairs = pairs
+        world.gems = gems
+        world.gem_index = {pos: idx for idx, pos in gems.items()}
+        world.destinations = destinations
+        return world
+
+    def stream(self, *key: int) -> np.random.SeedSequence:
+        """
+        Derive the seed sequence of one part of the world, see `MAP_STREAM`,
+        `PAIR_STREAM` and `GEM_STREAM`.
+        """
+        return np.random.SeedSequence(self.seed, spawn_key=key)
+
+    def rng(self, *key: int) -> random.Random:
+        """
+        Create a `random.Random` seeded from `stream(*key)`.
+        """
+        return random.Random(int(self.stream(*key).generate_state(1, np.uint64)[0]))
+
+    def map_stream(self, grid_pos: tuple[int, int], part: int) -> np.random.Generator:
+        """
+        Get one part of the stream of a map, see `map_stream`.
+        """
+        return map_stream(self.seed, grid_pos, part)
+
+    def get_map(
+        self,
+        grid_pos: tuple[int, int],
+        buffers: Optional[tuple[TileBuffer, TileBuffer]] = None,
+    ) -> Map:
+        """
+        Get a map of the grid, generating it or taking it from `tiles` on first
+        access. The least recently used maps beyond `capacity` are dropped.
+
+        Parameters:
+            grid_pos (tuple[int, int]): The map's position in the grid.
+            buffers (Optional[tuple[TileBuffer, TileBuffer]]): Tiles generated
+                elsewhere to build the map from, see `gen_map_data`.
+
+        Returns:
+            Map: The map.
+        """
+
+        x, y = grid_pos
+        if (target := self.maps[x][y]) == None:
+            tiles, stored = self.tiles, self.stored
+            sites = self.sites.get(grid_pos)
+            # Arrays compare by element
+            if buffers == None and tiles is not None and stored is not None:
+                if stored[x, y]:
+                    buffers = (tiles[x, y, 0], tiles[x, y, 1])
+                    sites = None  # Stored tiles may have been edited since
+            target = Map(
+                self.map_width,
+                self.map_height,
+                self.map_stream(grid_pos, TILE_PART) if buffers == None else None,
+                sites,
+                self.reserved.get(grid_pos, ()),
+                buffers,
+            )
+            if tiles is not None and stored is not None and not stored[x, y]:
+                # Keep edits across evictions
+                tiles[x, y, 0] = target.types
+                tiles[x, y, 1] = target.variants
+                target.types = tiles[x, y, 0]
+                target.variants = tiles[x, y, 1]
+                stored[x, y] = True
+            links = self.links[grid_pos]
+            target.set_portals(links)
+            for loc, landing in zip(links, target.landings(list(links))):
+                a, b = self.pairs[links[loc][0]]
+                source = a if b == (grid_pos, loc) else b
+                self.destinations[source] = (grid_pos, landing)
+            # Caches keyed on the revision stay valid for the same tiles
+            if self.revisions is not None and self.revisions[x, y] > 0:
+                target.revision = int(self.revisions[x, y])
+            self.maps[x][y] = target
+        if self.capacity > 0:
+            self.resident[grid_pos] = target
+            self.resident.move_to_end(grid_pos)
+            while len(self.resident) > self.capacity:
+                (old_x, old_y), old = self.resident.popitem(last=False)
+                if self.revisions is not None:
+                    self.revisions[old_x, old_y] = old.revision
+                self.maps[old_x][old_y] = None
+        return target
+
+    def destination(
+        self, grid_pos: tuple[int, int], portal: tuple[int, int]
+    ) -> tuple[tuple[int, int], tuple[int, int]]:
+        """
+        Look up where a paired portal leads.
+
+        Parameters:
+            grid_pos (tuple[int, int]): The map holding the portal.
+            portal (tuple[int, int]): The portal's location.
+
+        Returns:
+            tuple[tuple[int, int], tuple[int, int]]: The destination map and the
+                tile to land on.
+        """
+
+        if (found := self.destinations.get((grid_pos, portal))) == None:
+            # Landing tiles are picked when the destination map is generated
+            a, b = self.pairs[self.links[grid_pos][portal][0]]
+            self.get_map(a[0] if b == (grid_pos, portal) else b[0])
+            found = self.destinations[(grid_pos, portal)]
+        return found
+
+    def collect(self, map_pos: tuple[int, int]) -> Optional[int]:
+        """
+        Pick up the gem at a location of the focused map, if there is one.
+
+        Parameters:
+            map_pos (tuple[int, int]): The location in (x, y).
+
+        Returns:
+            Optional[int]: The index of the gem, or `None` if there is no
+                uncollected gem there.
+        """
+        return self.gem_index.pop((self.focus, map_pos), None)
 
     def jump(self, new_focus: tuple[int, int]) -> None:
+        self.get_map(new_focus)
         self.focus = new_focus
 
     def focus_map(self) -> Map:
-        x, y = self.focus
-        return self.maps[x][y]
+        return self.get_map(self.focus)
 
 
-def random_portal_color() -> int:
-    return random.choice([9, 12, 15, 21])
+def random_portal_color(rng: Optional[random.Random] = None) -> int:
+    return (rng if rng != None else random).choice([9, 12, 15, 21])
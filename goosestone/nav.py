@@ -0,0 +1,640 @@
+"""
+Navigation over maps.
+
+Passability grids are cached per map and rebuilt only when the map's revision
+changes, so repeated searches on the same map skip the array work. Routes
+across dimensions are found by `Router` over the portals rather than the tiles,
+and `Planner` orders the gems on top of those routes.
+"""
+
+import heapq
+import weakref
+from typing import Iterable, Optional
+
+import maps
+from config import PLAN_GEMS
+
+# Map -> (revision, flat passability by x * height + y)
+_passable: "weakref.WeakKeyDictionary[maps.Map, tuple[int, list[bool]]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def passable(terrain: maps.Map) -> list[bool]:
+    """
+    Get which tiles of a map can be walked through, flattened by
+    `x * height + y`. Only grassland is walkable, portals would teleport the
+    walker away.
+
+    Parameters:
+        terrain (maps.Map): The map.
+
+    Returns:
+        list[bool]: The cached passability grid.
+    """
+
+    cached = _passable.get(terrain)
+    if cached == None or cached[0] != terrain.revision:
+        grid = (terrain.types == maps.TileType.GRASSLAND.value).ravel().tolist()
+        cached = (terrain.revision, grid)
+        _passable[terrain] = cached
+    return cached[1]
+
+
+def find_path(
+    terrain: maps.Map, start: tuple[int, int], goal: tuple[int, int]
+) -> Optional[list[tuple[int, int]]]:
+    """
+    Find a shortest 4-way path across grassland with A*. The goal itself may be
+    any tile but a mountain, so that portals can be walked into.
+
+    Parameters:
+        terrain (maps.Map): The map.
+        start (tuple[int, int]): Where the path begins.
+        goal (tuple[int, int]): Where the path ends.
+
+    Returns:
+        Optional[list[tuple[int, int]]]: Every tile of the path from `start` to
+            `goal`, or `None` if `goal` cannot be reached.
+    """
+
+    width, height = terrain.width, terrain.height
+    if not (0 <= goal[0] < width and 0 <= goal[1] < height):
+        return None
+    if terrain.types[goal] == maps.TileType.MOUNTAIN.value:
+        return None
+    grid = passable(terrain)
+    source = start[0] * height + start[1]
+    target = goal[0] * height + goal[1]
+    gx, gy = goal
+    came: list[int] = [-1] * (width * height)
+    cost: list[int] = [width * height] * (width * height)
+    cost[source] = 0
+    # Ties go to the deepest entry, which keeps open ground from flooding
+    frontier: list[tuple[int, int, int]] = [
+        (abs(start[0] - gx) + abs(start[1] - gy), 0, source)
+    ]
+    while len(frontier) > 0:
+        _, depth, current = heapq.heappop(frontier)
+        if current == target:
+            path = [current]
+            while current != source:
+                current = came[current]
+                path.append(current)
+            return [divmod(index, height) for index in reversed(path)]
+        steps = -depth
+        if steps > cost[current]:  # Stale entry
+            continue
+        x, y = divmod(current, height)
+        for nx, ny, index in (
+            (x - 1, y, current - height),
+            (x + 1, y, current + height),
+            (x, y - 1, current - 1),
+            (x, y + 1, current + 1),
+        ):
+            if not (0 <= nx < width and 0 <= ny < height):
+                continue
+            if not grid[index] and index != target:
+                continue
+            if steps + 1 < cost[index]:
+                cost[index] = steps + 1
+                came[index] = current
+                estimate = steps + 1 + abs(nx - gx) + abs(ny - gy)
+                heapq.heappush(frontier, (estimate, -steps - 1, index))
+    return None
+
+
+def waypoints(path: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """
+    Reduce a path to the tiles where it turns, plus its end.
+    """
+
+    points: list[tuple[int, int]] = []
+    for i in range(1, len(path)):
+        if i == len(path) - 1:
+            points.append(path[i])
+        else:
+            (ax, ay), (bx, by), (cx, cy) = path[i - 1], path[i], path[i + 1]
+            if (bx - ax, by - ay) != (cx - bx, cy - by):
+                points.append(path[i])
+    return points
+
+
+def reach(
+    terrain: maps.Map, start: tuple[int, int], targets: set[tuple[int, int]]
+) -> dict[tuple[int, int], int]:
+    """
+    Find the walking distance from a tile to every reachable tile of a set with
+    a breadth-first search across grassland. Target tiles are entered but not
+    walked through.
+
+    Parameters:
+        terrain (maps.Map): The map.
+        start (tuple[int, int]): Where to walk from.
+        targets (set[tuple[int, int]]): The tiles to walk to.
+
+    Returns:
+        dict[tuple[int, int], int]: Steps to each reachable target.
+    """
+
+    width, height = terrain.width, terrain.height
+    grid = passable(terrain)
+    wanted = {x * height + y for x, y in targets}
+    found: dict[tuple[int, int], int] = {}
+    seen = bytearray(width * height)
+    seen[start[0] * height + start[1]] = 1
+    frontier = [start[0] * height + start[1]]
+    steps = 0
+    while len(frontier) > 0 and len(found) < len(wanted):
+        steps += 1
+        following: list[int] = []
+        for current in frontier:
+            x, y = divmod(current, height)
+            for nx, ny, index in (
+                (x - 1, y, current - height),
+                (x + 1, y, current + height),
+                (x, y - 1, current - 1),
+                (x, y + 1, current + 1),
+            ):
+                if not (0 <= nx < width and 0 <= ny < height) or seen[index]:
+                    continue
+                seen[index] = 1
+                if index in wanted:
+                    found[(nx, ny)] = steps
+                elif grid[index]:
+                    following.append(index)
+        frontier = following
+    return found
+
+
+class Router:
+    """
+    # Router
+
+    Finds which portals to take to reach another dimension, taking as few
+    portals as possible and walking as little as possible among those routes.
+
+    A breadth-first search over dimensions, linked by `MapGrid.pairs`, finds the
+    corridor of dimensions lying on routes with the fewest portals. Dijkstra
+    then runs over the portals in that corridor only, using walking distances
+    from each tile a map is entered at to each of its paired portals, computed
+    once per map. Routes are cached until a map they went through changes.
+    """
+
+    world: maps.MapGrid
+    exits_by_map: dict[tuple[int, int], list[tuple[tuple[int, int], tuple[int, int]]]]
+    hops: dict[tuple[int, int], dict[tuple[int, int], int]]  # From each source
+    # Map -> (revision, entry tile -> paired portal -> steps)
+    tables: dict[
+        tuple[int, int],
+        tuple[int, dict[tuple[int, int], dict[tuple[int, int], int]]],
+    ]
+    # (dimension, tile, target dimension, goal tile, shortest) -> route
+    routes: dict[
+        tuple[
+            tuple[int, int],
+            tuple[int, int],
+            tuple[int, int],
+            Optional[tuple[int, int]],
+            bool,
+        ],
+        Optional[tuple[int, list[tuple[tuple[int, int], tuple[int, int]]]]],
+    ]
+    generation: int  # Bumped whenever cached routes are dropped
+
+    def __init__(self, world: maps.MapGrid) -> None:
+        self.world = world
+        self.exits_by_map = {}
+        for a, b in world.pairs.values():
+            self.exits_by_map.setdefault(a[0], []).append((a[1], b[0]))
+            self.exits_by_map.setdefault(b[0], []).append((b[1], a[0]))
+        self.hops = {}
+        self.tables = {}
+        self.routes = {}
+        self.generation = 0
+
+    def table(
+        self, grid_pos: tuple[int, int]
+    ) -> dict[tuple[int, int], dict[tuple[int, int], int]]:
+        """
+        Get the walking distances from the entry tiles of a map to its paired
+        portals, rebuilding them and dropping cached routes if the map changed.
+        """
+
+        terrain = self.world.get_map(grid_pos)
+        cached = self.tables.get(grid_pos)
+        if cached == None or cached[0] != terrain.revision:
+            if cached != None:
+                self.routes.clear()
+                self.generation += 1
+            portals = set(self.world.links[grid_pos])
+            entries = set(terrain.landings(list(portals)))
+            cached = (
+                terrain.revision,
+                {entry: reach(terrain, entry, portals) for entry in entries},
+            )
+            self.tables[grid_pos] = cached
+        return cached[1]
+
+    def exits(
+        self, grid_pos: tuple[int, int], tile: tuple[int, int]
+    ) -> dict[tuple[int, int], int]:
+        """
+        Get the walking distances from any tile of a map to its paired portals.
+        """
+
+        table = self.table(grid_pos)
+        if (found := table.get(tile)) == None:
+            terrain = self.world.get_map(grid_pos)
+            found = reach(terrain, tile, set(self.world.links[grid_pos]))
+            table[tile] = found
+        return found
+
+    def hop_counts(self, source: tuple[int, int]) -> dict[tuple[int, int], int]:
+        """
+        Get the fewest portals to take from a dimension to every dimension it
+        leads to, with a breadth-first search over the dimensions.
+        """
+
+        if (forward := self.hops.get(source)) == None:
+            forward = {source: 0}
+            frontier = [source]
+            while len(frontier) > 0:
+                following: list[tuple[int, int]] = []
+                for current in frontier:
+                    for _, dest in self.exits_by_map.get(current, []):
+                        if dest not in forward:
+                            forward[dest] = forward[current] + 1
+                            following.append(dest)
+                frontier = following
+            self.hops[source] = forward
+        return forward
+
+    def corridor(
+        self, source: tuple[int, int], target: tuple[int, int]
+    ) -> Optional[dict[tuple[int, int], int]]:
+        """
+        Find the dimensions on routes with the fewest portals between two
+        dimensions.
+
+        Returns:
+            Optional[dict[tuple[int, int], int]]: Portals taken to reach each
+                dimension of the corridor, or `None` if there is no route.
+        """
+
+        forward = self.hop_counts(source)
+        if (total := forward.get(target)) == None:
+            return None
+        found = {target: total}
+        frontier = [target]
+        for depth in range(total - 1, -1, -1):
+            following: list[tuple[int, int]] = []
+            for current in frontier:
+                for _, dest in self.exits_by_map.get(current, []):
+                    if dest not in found and forward.get(dest) == depth:
+                        found[dest] = depth
+                        following.append(dest)
+            frontier = following
+        return found
+
+    def route(
+        self,
+        grid_pos: tuple[int, int],
+        tile: tuple[int, int],
+        target: tuple[int, int],
+        goal: Optional[tuple[int, int]] = None,
+        shortest: bool = False,
+    ) -> Optional[tuple[int, list[tuple[tuple[int, int], tuple[int, int]]]]]:
+        """
+        Find a route from a tile to another dimension, or to a tile of it.
+
+        Parameters:
+            grid_pos (tuple[int, int]): The dimension to start in.
+            tile (tuple[int, int]): The tile to start from.
+            target (tuple[int, int]): The dimension to reach.
+            goal (Optional[tuple[int, int]]): The tile of `target` to walk to,
+                or `None` to stop on arrival.
+            shortest (bool): Walk as little as possible whatever the portals
+                taken, searching every route instead of the corridor.
+
+        Returns:
+            Optional[tuple[int, list[tuple[tuple[int, int], tuple[int, int]]]]]:
+                The steps walked and the `(dimension, portal)` to enter at each
+                hop, or `None` if the dimension cannot be reached.
+        """
+
+        key = (grid_pos, tile, target, goal, shortest)
+        if key in self.routes:
+            found = self.routes[key]
+            passed = [hop for hop, _ in found[1]] if found != None else []
+            for hop in {grid_pos, target, *passed}:
+                self.table(hop)  # Drops the cache if a map has changed
+            if key in self.routes:
+                return found
+        if (corridor := self.corridor(grid_pos, target)) == None:
+            found = None
+        elif shortest:
+            found = self.search(grid_pos, tile, target, goal, None)
+        else:
+            # Walls of mountains may cut the corridor, then try every route
+            found = self.search(grid_pos, tile, target, goal, corridor)
+            if found == None:
+                found = self.search(grid_pos, tile, target, goal, None)
+        self.routes[key] = found
+        return found
+
+    def search(
+        self,
+        grid_pos: tuple[int, int],
+        tile: tuple[int, int],
+        target: tuple[int, int],
+        goal: Optional[tuple[int, int]],
+        corridor: Optional[dict[tuple[int, int], int]],
+    ) -> Optional[tuple[int, list[tuple[tuple[int, int], tuple[int, int]]]]]:
+        """
+        Run Dijkstra over portals from a tile until `target` is entered, or its
+        `goal` tile walked to, only moving one dimension further along
+        `corridor` at each hop if given. Nodes are `(dimension, tile)` where the
+        walker stands after a teleport.
+        """
+
+        start = (grid_pos, tile)
+        cost = {start: 0}
+        # Node -> (node before, portal entered or None if walked)
+        previous: dict[
+            tuple[tuple[int, int], tuple[int, int]],
+            tuple[tuple[tuple[int, int], tuple[int, int]], Optional[tuple[int, int]]],
+        ] = {}
+        heap = [(0, start)]
+        while len(heap) > 0:
+            steps, node = heapq.heappop(heap)
+            if steps > cost[node]:  # Stale entry
+                continue
+            current, standing = node
+            if current == target and (goal == None or standing == goal):
+                hops: list[tuple[tuple[int, int], tuple[int, int]]] = []
+                while node in previous:
+                    node, portal = previous[node]
+                    if portal != None:
+                        hops.append((node[0], portal))
+                hops.reverse()
+                return steps, hops
+            if current == target and goal != None:
+                walk = self.world.get_map(target).distance(standing, {goal})
+                final = (target, goal)
+                if walk != None and steps + walk < cost.get(final, steps + walk + 1):
+                    cost[final] = steps + walk
+                    previous[final] = (node, None)
+                    heapq.heappush(heap, (steps + walk, final))
+            reachable = self.exits(current, standing)
+            for portal, dest in self.exits_by_map.get(current, []):
+                if portal not in reachable:
+                    continue
+                if corridor != None and corridor.get(dest) != corridor[current] + 1:
+                    continue
+                following = self.world.destination(current, portal)
+                total = steps + reachable[portal]
+                if total < cost.get(following, total + 1):
+                    cost[following] = total
+                    previous[following] = (node, portal)
+                    heapq.heappush(heap, (total, following))
+        return None
+
+    def distances(
+        self,
+        grid_pos: tuple[int, int],
+        tile: tuple[int, int],
+        goals: Iterable[tuple[tuple[int, int], tuple[int, int]]],
+    ) -> dict[tuple[tuple[int, int], tuple[int, int]], int]:
+        """
+        Find the fewest steps from a tile to each of many tiles of the world,
+        through any portals, with one Dijkstra search stopping once every goal
+        is reached.
+
+        Parameters:
+            grid_pos (tuple[int, int]): The dimension to start in.
+            tile (tuple[int, int]): The tile to start from.
+            goals (Iterable[tuple[tuple[int, int], tuple[int, int]]]): The
+                `(dimension, tile)` to walk to.
+
+        Returns:
+            dict[tuple[tuple[int, int], tuple[int, int]], int]: Steps to each
+                reachable goal.
+        """
+
+        wanted: dict[tuple[int, int], set[tuple[int, int]]] = {}
+        for goal_grid, goal in goals:
+            wanted.setdefault(goal_grid, set()).add(goal)
+        count = sum(len(tiles) for tiles in wanted.values())
+        found: dict[tuple[tuple[int, int], tuple[int, int]], int] = {}
+        start = (grid_pos, tile)
+        cost = {start: 0}
+        heap = [(0, start)]
+        while len(heap) > 0 and len(found) < count:
+            steps, node = heapq.heappop(heap)
+            if steps > cost[node]:  # Stale entry
+                continue
+            current, standing = node
+            moves: list[tuple[int, tuple[tuple[int, int], tuple[int, int]]]] = []
+            if current in wanted:
+                if standing in wanted[current]:
+                    found[node] = steps
+                terrain = self.world.get_map(current)
+                for goal in wanted[current]:
+                    if (walk := terrain.distance(standing, {goal})) != None:
+                        moves.append((walk, (current, goal)))
+            reachable = self.exits(current, standing)
+            for portal, _ in self.exits_by_map.get(current, []):
+                if portal in reachable:
+                    moves.append(
+                        (reachable[portal], self.world.destination(current, portal))
+                    )
+            for walk, following in moves:
+                if steps + walk < cost.get(following, steps + walk + 1):
+                    cost[following] = steps + walk
+                    heapq.heappush(heap, (steps + walk, following))
+        return found
+
+
+class Planner:
+    """
+    # Planner
+
+    Plans the order to collect the remaining gems of a world in as few steps as
+    possible, with the shortest walks between gems found by a `Router`.
+
+    The order is found with Held-Karp dynamic programming: `tours` holds, for
+    each gem and set of gems left after it, the fewest steps to collect that
+    set starting from the gem, and which gem to take next. Tours do not depend
+    on where the goose stands, so they are kept across plans and each plan only
+    searches from the goose once. Everything is dropped when the router drops
+    its routes.
+
+    The work grows as `2 ** n` with `n` gems, so only the `window` gems nearest
+    to the goose are planned, which is exact as long as no more gems are left.
+    """
+
+    router: Router
+    window: int  # Most gems planned at once
+    legs: dict[tuple[int, int], Optional[int]]  # (gem, gem) -> steps
+    # (gem, bitmask of gems left) -> (steps, next gem), steps `None` if stuck
+    tours: dict[tuple[int, int], tuple[Optional[int], int]]
+    generation: int  # Generation of `router` the memos were made in
+
+    def __init__(self, router: Router, window: int = PLAN_GEMS) -> None:
+        self.router = router
+        self.window = window
+        self.legs = {}
+        self.tours = {}
+        self.generation = router.generation
+
+    def nearest(
+        self, grid_pos: tuple[int, int], tile: tuple[int, int], gems: list[int]
+    ) -> list[int]:
+        """
+        Pick the `window` gems nearest to a tile: gems of its own map by walking
+        distance, then gems of other maps by portals to take.
+        """
+
+        if len(gems) <= self.window:
+            return gems
+        world = self.router.world
+        hops = self.router.hop_counts(grid_pos)
+        here = [world.gems[gem][1] for gem in gems if world.gems[gem][0] == grid_pos]
+        field = world.get_map(grid_pos).distance_field(here)
+        far = world.map_width * world.map_height  # Farther than any walk
+
+        def key(gem: int) -> tuple[int, int, int]:
+            gem_grid, gem_tile = world.gems[gem]
+            if gem_grid == grid_pos and field[gem_tile] >= 0:
+                return (0, int(field[gem_tile]), gem)
+            return (hops.get(gem_grid, far) + 1, 0, gem)
+
+        return sorted(gems, key=key)[: self.window]
+
+    def measure(self, gems: list[int]) -> None:
+        """
+        Fill `legs` between every two of some gems, with one search from each
+        gem missing some.
+        """
+
+        world = self.router.world
+        for source in gems:
+            missing = [gem for gem in gems if (source, gem) not in self.legs]
+            if len(missing) == 0:
+                continue
+            found = self.router.distances(
+                *world.gems[source], [world.gems[gem] for gem in missing]
+            )
+            for gem in missing:
+                self.legs[(source, gem)] = found.get(world.gems[gem])
+
+    def tour(self, gem: int, rest: int) -> tuple[Optional[int], int]:
+        """
+        Find the fewest steps to collect every gem in the bitmask `rest`
+        starting from `gem`, and the gem to take next. Legs between the gems
+        must have been measured.
+
+        Parameters:
+            gem (int): The gem to start from.
+            rest (int): The gems left to collect, bit `i` for gem `i`.
+
+        Returns:
+            tuple[Optional[int], int]: The steps, or `None` if some gem cannot
+                be reached, and the next gem, or -1 if `rest` is empty.
+        """
+
+        if rest == 0:
+            return (0, -1)
+        if (found := self.tours.get((gem, rest))) != None:
+            return found
+        best: tuple[Optional[int], int] = (None, -1)
+        following = rest
+        while following != 0:
+            bit = following & -following  # Lowest gem left
+            following ^= bit
+            nxt = bit.bit_length() - 1
+            if (walk := self.legs[(gem, nxt)]) == None:
+                continue
+            if (after := self.tour(nxt, rest ^ bit)[0]) == None:
+                continue
+            if best[0] == None or walk + after < best[0]:
+                best = (walk + after, nxt)
+        self.tours[(gem, rest)] = best
+        return best
+
+    def plan(
+        self, grid_pos: tuple[int, int], tile: tuple[int, int]
+    ) -> Optional[tuple[int, list[int]]]:
+        """
+        Plan the order to collect the remaining gems from a tile, or the nearest
+        `window` of them. Gems that cannot be reached from the tile are left out.
+
+        Parameters:
+            grid_pos (tuple[int, int]): The dimension to start in.
+            tile (tuple[int, int]): The tile to start from.
+
+        Returns:
+            Optional[tuple[int, list[int]]]: The steps and the gems in order, or
+                `None` if no gem can be reached.
+        """
+
+        world = self.router.world
+        while True:
+            if self.generation != self.router.generation:
+                self.legs.clear()
+                self.tours.clear()
+                self.generation = self.router.generation
+            gems = self.nearest(grid_pos, tile, sorted(world.gem_index.values()))
+            starts = self.router.distances(
+                grid_pos, tile, [world.gems[gem] for gem in gems]
+            )
+            gems = [gem for gem in gems if world.gems[gem] in starts]
+            self.measure(gems)
+            left = 0
+            for gem in gems:
+                left |= 1 << gem
+            best: Optional[tuple[int, int]] = None
+            for gem in gems:
+                if (after := self.tour(gem, left ^ (1 << gem))[0]) == None:
+                    continue
+                walk = starts[world.gems[gem]]
+                if best == None or walk + after < best[0]:
+                    best = (walk + after, gem)
+            if self.generation == self.router.generation:  # No map changed
+                break
+        if best == None:
+            return None
+        order = [best[1]]
+        left ^= 1 << best[1]
+        while left != 0:
+            order.append(self.tour(order[-1], left)[1])
+            left ^= 1 << order[-1]
+        return best[0], order
+
+    def hint(
+        self, grid_pos: tuple[int, int], tile: tuple[int, int]
+    ) -> Optional[tuple[int, tuple[int, int]]]:
+        """
+        Find the next gem to collect and where to walk to on the current map:
+        the gem itself, or the first portal on the way.
+
+        Parameters:
+            grid_pos (tuple[int, int]): The dimension to start in.
+            tile (tuple[int, int]): The tile to start from.
+
+        Returns:
+            Optional[tuple[int, tuple[int, int]]]: The gem and the tile, or
+                `None` if there is no plan.
+        """
+
+        if (planned := self.plan(grid_pos, tile)) == None:
+            return None
+        gem = planned[1][0]
+        world = self.router.world
+        found = self.router.route(grid_pos, tile, *world.gems[gem], shortest=True)
+        if found == None:
+            return None
+        if len(found[1]) == 0:
+            return gem, world.gems[gem][1]
+        return gem, found[1][0][1]
@@ -4,23 +4,44 @@ render.py
 
 This module provides high-level functions needed for drawing game textures. The
 size of a regular texture is 32 by 16, while a double-height texture's size is
-32 by 32.
+32 by 32. Bitmap glyphs from the type set are 9 by 15.
 """
 
 import os
+from collections.abc import Generator
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Optional, Union, cast
 
+import config
 import pygame as pg
-import util
 
 TILE_WIDTH: int = 32
 TILE_HEIGHT: int = 16
 TYPE_WIDTH: int = 9
 TYPE_HEIGHT: int = 15
 
+_tiles: list[list[pg.Surface]] = []  # Regular textures indexed by [x][y]
+_tiles_2h: list[list[pg.Surface]] = []  # Double-height textures indexed by [x][y]
+_glyphs: list[dict[str, pg.Surface]] = []  # Bitmap glyphs by [color][character]
+
+# Glyph colors in the type set. Color 0 covers "!" to "~", the others only "!" to "?".
+TYPE_PALETTE: list[tuple[int, int, int]] = [
+    (149, 164, 136),
+    (11, 117, 21),
+    (38, 90, 120),
+    (159, 61, 35),
+    (221, 197, 20),
+    (117, 69, 96),
+    (70, 232, 166),
+    (63, 60, 59),
+]
+
 
 def init() -> None:
     """
-    Load and initialize tile and type sets into the memory.
+    Load and initialize tile and type sets into the memory, and slice them into
+    lookup tables of textures and glyphs.
 
     Parameters:
         None: Nothing to pass in.
@@ -29,23 +50,240 @@ def init() -> None:
         None: Nothing to return.
     """
 
-    global TILE, TEXT
+    global TILE, TEXT, _tiles, _tiles_2h, _glyphs
     tile_path = os.path.join("assets", "tileset.png")
     text_path = os.path.join("assets", "type.png")
 
+    def load(path: str) -> pg.Surface:
+        image = pg.image.load(path)
+        if cast(Optional[pg.Surface], pg.display.get_surface()) != None:
+            image = image.convert_alpha()  # Match the display for fast blits
+        return image
+
     def inner() -> tuple[pg.Surface, pg.Surface]:
         try:
-            tile = pg.image.load(os.path.join("goosestone", tile_path)).convert_alpha()
-            text = pg.image.load(os.path.join("goosestone", text_path)).convert_alpha()
+            tile = load(os.path.join("goosestone", tile_path))
+            text = load(os.path.join("goosestone", text_path))
         except FileNotFoundError:
-            tile = pg.image.load(tile_path).convert_alpha()
-            text = pg.image.load(text_path).convert_alpha()
+            tile = load(tile_path)
+            text = load(text_path)
         return tile, text
 
     TILE, TEXT = inner()
+    _tiles, _tiles_2h = slice_tiles(TILE)
+    _glyphs = slice_glyphs(TEXT)
+
+
+def texture(src: tuple[int, int]) -> pg.Surface:
+    """
+    Get a regular texture at a position in the tile set in (x, y).
+    """
+    return _tiles[src[0]][src[1]]
+
+
+def texture_2h(src: tuple[int, int]) -> pg.Surface:
+    """
+    Get a double-height texture at a position in the tile set in (x, y).
+    """
+    return _tiles_2h[src[0]][src[1]]
+
+
+def glyph_set(color: int = 0) -> dict[str, pg.Surface]:
+    """
+    Get the bitmap glyphs of a color in `TYPE_PALETTE` by character.
+    """
+    return _glyphs[color]
+
+
+def slice_tiles(
+    tile: pg.Surface,
+) -> tuple[list[list[pg.Surface]], list[list[pg.Surface]]]:
+    """
+    Slice a tile set into subsurfaces of every regular and double-height texture.
+    Double-height textures in the last row are cut short by the tile set's edge.
+
+    Parameters:
+        tile (pygame.Surface): The tile set.
+
+    Returns:
+        tuple[list[list[pygame.Surface]], list[list[pygame.Surface]]]: Regular
+        and double-height textures, both indexed by `[x][y]`.
+    """
+
+    bounds: pg.Rect = tile.get_rect()
+    columns: int = bounds.width // TILE_WIDTH
+    rows: int = bounds.height // TILE_HEIGHT
+
+    def cut(x: int, y: int, height: int) -> pg.Surface:
+        area = pg.Rect(x * TILE_WIDTH, y * TILE_HEIGHT, TILE_WIDTH, height)
+        return tile.subsurface(area.clip(bounds))
+
+    regular = [[cut(x, y, TILE_HEIGHT) for y in range(rows)] for x in range(columns)]
+    double = [[cut(x, y, 2 * TILE_HEIGHT) for y in range(rows)] for x in range(columns)]
+    return regular, double
+
+
+def slice_glyphs(text: pg.Surface) -> list[dict[str, pg.Surface]]:
+    """
+    Slice a type set into subsurfaces of every glyph. The first three rows hold
+    "!" to "~" in the base color, followed by a blank row and one row of "!" to
+    "?" for each other color in `TYPE_PALETTE`.
+
+    Parameters:
+        text (pygame.Surface): The type set.
+
+    Returns:
+        list[dict[str, pygame.Surface]]: Glyphs indexed by `[color][character]`.
+    """
+
+    columns: int = text.get_width() // TYPE_WIDTH
+
+    def cut(column: int, row: int) -> pg.Surface:
+        return text.subsurface(
+            (column * TYPE_WIDTH, row * TYPE_HEIGHT, TYPE_WIDTH, TYPE_HEIGHT)
+        )
+
+    base = {chr(33 + i): cut(i % columns, i // columns) for i in range(ord("~") - 32)}
+    colored = [
+        {chr(33 + i): cut(i, row) for i in range(ord("?") - 32)}
+        for row in range(4, 3 + len(TYPE_PALETTE))
+    ]
+    return [base] + colored
+
+
+class Batch:
+    """
+    # Batch
+
+    Collects blits aimed at one `Surface` and submits them with a single
+    `Surface.fblits` or `Surface.blits` call. Blits queued under another clip
+    area of the surface are submitted separately, each under its own clip.
+    """
+
+    surface: pg.Surface
+    sequence: list[tuple[pg.Surface, tuple[int, int]]]
+    clip: pg.Rect  # Clip area of the surface when `sequence` was queued
+
+    def __init__(self, surface: pg.Surface) -> None:
+        self.surface = surface
+        self.sequence = []
+        self.clip = surface.get_clip()
+
+    def track(self) -> pg.Rect:
+        """
+        Submit the queued blits if the clip area has changed since they were
+        queued, and get the current clip area.
+        """
+
+        if (clip := self.surface.get_clip()) != self.clip:
+            self.flush()
+            self.clip = clip
+        return clip
+
+    def blit(self, source: pg.Surface, dest: tuple[int, int]) -> pg.Rect:
+        area = self.track()
+        self.sequence.append((source, dest))
+        return pg.Rect(dest, source.get_size()).clip(area)
+
+    def flush(self) -> None:
+        if len(self.sequence) > 0:
+            current = self.surface.get_clip()
+            self.surface.set_clip(self.clip)
+            submit(self.surface, self.sequence)
+            self.surface.set_clip(current)
+            self.sequence = []
+
 
+_batches: list[Batch] = []  # Active batches, innermost last
 
-def draw_tile(surface: pg.Surface, src: tuple[int, int], dest: tuple[int, int]) -> None:
+
+@contextmanager
+def batch(*surfaces: pg.Surface) -> Generator[None, None, None]:
+    """
+    Queue every draw call of this module aimed at `surfaces` until the `with`
+    block ends, then submit them at once in their original order.
+
+    Parameters:
+        *surfaces (pygame.Surface): The target surfaces.
+
+    Returns:
+        Generator[None, None, None]: Nothing to yield.
+    """
+
+    current = [Batch(surface) for surface in surfaces]
+    _batches.extend(current)
+    try:
+        yield
+    finally:
+        for active in current:
+            _batches.remove(active)
+            active.flush()
+
+
+@contextmanager
+def clip(surface: pg.Surface, area: pg.Rect) -> Generator[None, None, None]:
+    """
+    Restrict drawing to `surface` to an area, within its current clip area,
+    until the `with` block ends.
+
+    Parameters:
+        surface (pygame.Surface): The target surface.
+        area (pygame.Rect): The area to draw in.
+
+    Returns:
+        Generator[None, None, None]: Nothing to yield.
+    """
+
+    previous = surface.get_clip()
+    surface.set_clip(previous.clip(area))
+    try:
+        yield
+    finally:
+        surface.set_clip(previous)
+
+
+def find_batch(surface: pg.Surface) -> Optional[Batch]:
+    for active in reversed(_batches):
+        if active.surface is surface:
+            return active
+    return None
+
+
+def submit(
+    surface: pg.Surface, sequence: list[tuple[pg.Surface, tuple[int, int]]]
+) -> None:
+    if (fblits := getattr(surface, "fblits", None)) != None:
+        fblits(sequence)  # pygame-ce
+    else:
+        surface.blits(sequence, doreturn=False)
+
+
+def blit(surface: pg.Surface, source: pg.Surface, dest: tuple[int, int]) -> pg.Rect:
+    """
+    Blit `source` to `surface`, or queue it if a batch for `surface` is active.
+
+    Returns:
+        pygame.Rect: The area of `surface` that has been (or will be) changed.
+    """
+
+    if (active := find_batch(surface)) != None:
+        return active.blit(source, dest)
+    return surface.blit(source, dest)
+
+
+def blits(
+    surface: pg.Surface, sequence: list[tuple[pg.Surface, tuple[int, int]]]
+) -> None:
+    if (active := find_batch(surface)) != None:
+        active.track()
+        active.sequence += sequence
+    else:
+        submit(surface, sequence)
+
+
+def draw_tile(
+    surface: pg.Surface, src: tuple[int, int], dest: tuple[int, int]
+) -> pg.Rect:
     """
     Draws a regular texture at specified position in the tile set to a specified `Surface`.
 
@@ -55,15 +293,19 @@ def draw_tile(surface: pg.Surface, src: tuple[int, int], dest: tuple[int, int])
         dest (tuple[int, int]): The target position in (x, y).
 
     Returns:
-        None: Nothing to return.
+        pygame.Rect: The area of `surface` that has been changed.
     """
 
-    draw_tile_custom(surface, src, util.map_to_screen(dest))
+    return blit(
+        surface,
+        texture(src),
+        (dest[0] * TILE_WIDTH, dest[1] * TILE_HEIGHT),
+    )
 
 
 def draw_tile_2h(
     surface: pg.Surface, src: tuple[int, int], dest: tuple[int, int]
-) -> None:
+) -> pg.Rect:
     """
     Draws a double-height texture at specified location in the tile set to a specified `Surface`.
 
@@ -73,29 +315,346 @@ def draw_tile_2h(
         dest (tuple[int, int]): The target position in (x, y).
 
     Returns:
-        None: Nothing to return.
+        pygame.Rect: The area of `surface` that has been changed.
     """
 
-    draw_tile_2h_custom(surface, src, util.map_to_screen((dest[0], dest[1] - 1)))
+    return blit(
+        surface,
+        texture_2h(src),
+        (dest[0] * TILE_WIDTH, (dest[1] - 1) * TILE_HEIGHT),
+    )
 
 
 def draw_tile_custom(
     surface: pg.Surface, src: tuple[int, int], dest: tuple[int, int]
-) -> None:
-    origin: tuple[int, int] = util.map_to_screen(src)
-    surface.blit(
-        TILE,
-        dest,
-        area=(origin[0], origin[1], TILE_WIDTH, TILE_HEIGHT),
-    )
+) -> pg.Rect:
+    return blit(surface, texture(src), dest)
 
 
 def draw_tile_2h_custom(
     surface: pg.Surface, src: tuple[int, int], dest: tuple[int, int]
-) -> None:
-    origin: tuple[int, int] = util.map_to_screen(src)
-    surface.blit(
-        TILE,
-        dest,
-        area=(origin[0], origin[1], TILE_WIDTH, 2 * TILE_HEIGHT),
+) -> pg.Rect:
+    return blit(surface, texture_2h(src), dest)
+
+
+def draw_type(
+    surface: pg.Surface, text: str, dest: tuple[int, int], color: int = 0
+) -> pg.Rect:
+    """
+    Draws a string with bitmap glyphs from the type set to a specified `Surface`.
+    If any character is missing in `color`, the whole string falls back to the
+    base color so that it is never drawn in mixed colors.
+
+    Parameters:
+        surface (pygame.Surface): The target surface.
+        text (str): The string to draw.
+        dest (tuple[int, int]): The target position in pixels.
+        color (int): Index of the glyph color in `TYPE_PALETTE`.
+
+    Returns:
+        pygame.Rect: The area of `surface` that has been changed.
+    """
+
+    glyphs: dict[str, pg.Surface] = glyph_set(color)
+    base: dict[str, pg.Surface] = glyph_set()
+    if any(char not in glyphs and char in base for char in text):
+        glyphs = base
+    x, y = dest
+    sequence: list[tuple[pg.Surface, tuple[int, int]]] = []
+    for char in text:
+        if (glyph := glyphs.get(char)) != None:
+            sequence.append((glyph, (x, y)))
+        x += TYPE_WIDTH
+    blits(surface, sequence)
+    return pg.Rect(dest, (len(text) * TYPE_WIDTH, TYPE_HEIGHT)).clip(surface.get_rect())
+
+
+@lru_cache(maxsize=config.TEXT_CACHE_SIZE)
+def render_type(text: str, color: int = 0) -> pg.Surface:
+    """
+    Render a string with bitmap glyphs into a cached transparent `Surface`. The
+    returned `Surface` is shared between callers, so it must not be modified.
+
+    Parameters:
+        text (str): The string to render.
+        color (int): Index of the glyph color in `TYPE_PALETTE`.
+
+    Returns:
+        pygame.Surface: The rendered text.
+    """
+
+    surface = pg.Surface((len(text) * TYPE_WIDTH, TYPE_HEIGHT), pg.SRCALPHA)
+    draw_type(surface, text, (0, 0), color)
+    return surface
+
+
+def type_color(color: Union[pg.Color, tuple[int, ...]]) -> int:
+    """
+    Find the glyph color in `TYPE_PALETTE` closest to an arbitrary color.
+    """
+
+    r, g, b, _ = pg.Color(color)
+    return min(
+        range(len(TYPE_PALETTE)),
+        key=lambda i: (TYPE_PALETTE[i][0] - r) ** 2
+        + (TYPE_PALETTE[i][1] - g) ** 2
+        + (TYPE_PALETTE[i][2] - b) ** 2,
     )
+
+
+def render_label(
+    text: str, size: int, color: Union[pg.Color, tuple[int, ...]]
+) -> pg.Surface:
+    """
+    Render HUD text with the bitmap type set if `config.BITMAP_TEXT` is set, or
+    with the default TrueType font otherwise. Bitmap glyphs ignore `size`.
+
+    Parameters:
+        text (str): The string to render.
+        size (int): The font size.
+        color (pygame.Color | tuple[int, ...]): The text color.
+
+    Returns:
+        pygame.Surface: The rendered text.
+    """
+
+    if config.BITMAP_TEXT:
+        return render_type(text, type_color(color))
+    return render_text(text, size, color)
+
+
+@lru_cache(maxsize=None)
+def get_font(name: Optional[str], size: int) -> pg.font.Font:
+    """
+    Get a shared `Font` object from the font registry.
+
+    Parameters:
+        name (Optional[str]): Path to the font file, or `None` for the default font.
+        size (int): The font size.
+
+    Returns:
+        pygame.font.Font: The font, created on first use.
+    """
+
+    return pg.font.Font(name, size)
+
+
+@lru_cache(maxsize=config.TEXT_CACHE_SIZE)
+def _render_text(
+    name: Optional[str],
+    size: int,
+    text: str,
+    color: tuple[int, ...],
+    antialias: bool,
+) -> pg.Surface:
+    return get_font(name, size).render(text, antialias, color)
+
+
+def render_text(
+    text: str,
+    size: int,
+    color: Union[pg.Color, tuple[int, ...]],
+    name: Optional[str] = None,
+    antialias: bool = config.TEXT_ANTIALIASING,
+) -> pg.Surface:
+    """
+    Render a string with a TrueType font through a bounded LRU cache. The returned
+    `Surface` is shared between callers, so it must not be modified.
+
+    Parameters:
+        text (str): The string to render.
+        size (int): The font size.
+        color (pygame.Color | tuple[int, ...]): The text color.
+        name (Optional[str]): Path to the font file, or `None` for the default font.
+        antialias (bool): Whether to smooth the glyphs.
+
+    Returns:
+        pygame.Surface: The rendered text.
+    """
+
+    return _render_text(name, size, text, tuple(pg.Color(color)), antialias)
+
+
+def text_cache_info() -> tuple[int, int, Optional[int], int]:
+    """
+    Return the `(hits, misses, maxsize, currsize)` statistics of the text cache.
+    """
+
+    return _render_text.cache_info()
+
+
+def clear_text_cache() -> None:
+    """
+    Drop every cached text surface and font, e.g. after `pygame.font.quit()`.
+    """
+
+    _render_text.cache_clear()
+    render_type.cache_clear()
+    get_font.cache_clear()
+
+
+class DepthQueue:
+    """
+    # DepthQueue
+
+    Orders draw calls by map row with a bucket sort, so that whatever stands
+    lower on the map covers whatever stands above it. Calls in the same row keep
+    their insertion order.
+
+    Only a window of rows starting at `first` gets its own bucket, rows outside
+    it are drawn with the nearest edge row, so the cost follows the view rather
+    than the map.
+    """
+
+    buckets: list[list[Callable[[], Optional[pg.Rect]]]]
+    first: int  # Map row of the first bucket
+
+    def __init__(self, rows: int, first: int = 0) -> None:
+        self.buckets = [[] for _ in range(rows + 1)]  # The extra bucket goes on top
+        self.first = first
+
+    def push(self, row: Optional[int], draw: Callable[[], Optional[pg.Rect]]) -> None:
+        """
+        Queue a draw call. A `None` row is drawn after every map row.
+        """
+
+        last = len(self.buckets) - 1
+        if row == None:
+            self.buckets[last].append(draw)
+        else:
+            self.buckets[min(max(row - self.first, 0), last - 1)].append(draw)
+
+    def flush(self) -> list[pg.Rect]:
+        """
+        Run every queued draw call in depth order and empty the queue.
+
+        Returns:
+            list[pygame.Rect]: Areas touched by the draw calls.
+        """
+
+        rects: list[pg.Rect] = []
+        for bucket in self.buckets:
+            for draw in bucket:
+                if (rect := draw()) != None:
+                    rects.append(rect)
+            bucket.clear()
+        return rects
+
+
+class Layer:
+    """
+    # Layer
+
+    An off-screen surface merged by `Compositor`. A static layer keeps its
+    content across frames until it is invalidated, while a dynamic layer is
+    cleared under the areas changed in the previous frame.
+    """
+
+    name: str
+    surface: pg.Surface
+    static: bool
+    dirty: bool  # Whether a static layer must be redrawn
+
+    def __init__(self, name: str, surface: pg.Surface, static: bool) -> None:
+        self.name = name
+        self.surface = surface
+        self.static = static
+        self.dirty = True
+
+
+class Compositor:
+    """
+    # Compositor
+
+    Merges a stack of named layers into a target surface once per frame. Only
+    the areas changed in the current or previous frame are merged, unless a
+    static layer has been redrawn.
+    """
+
+    size: tuple[int, int]
+    layers: list[Layer]  # From bottom to top
+    previous: list[pg.Rect]
+    full: bool  # Whether the next frame must merge the whole screen
+
+    def __init__(self, size: tuple[int, int]) -> None:
+        self.size = size
+        self.layers = []
+        self.previous = []
+        self.full = True
+
+    def add_layer(self, name: str, static: bool = False) -> Layer:
+        """
+        Put a new layer on top of the stack. The bottom layer is opaque, every
+        other layer is transparent.
+
+        Parameters:
+            name (str): The layer's name.
+            static (bool): Whether the layer is kept across frames.
+
+        Returns:
+            Layer: The new layer.
+        """
+
+        if len(self.layers) == 0:
+            surface = pg.Surface(self.size)
+        else:
+            surface = pg.Surface(self.size, pg.SRCALPHA)
+            surface.fill((0, 0, 0, 0))
+        if cast(Optional[pg.Surface], pg.display.get_surface()) != None:
+            surface = (
+                surface.convert() if len(self.layers) == 0 else surface.convert_alpha()
+            )
+        layer = Layer(name, surface, static)
+        self.layers.append(layer)
+        return layer
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """
+        Mark a static layer, or every static layer if `None`, for redrawing.
+        """
+
+        for layer in self.layers:
+            if layer.static and (name == None or layer.name == name):
+                layer.dirty = True
+                self.full = True
+
+    def clear(self) -> None:
+        """
+        Clear the dynamic layers under the areas changed in the previous frame.
+        """
+
+        for layer in self.layers:
+            if layer.static:
+                continue
+            if self.full:
+                layer.surface.fill((0, 0, 0, 0))
+            else:
+                for rect in self.previous:
+                    layer.surface.fill((0, 0, 0, 0), rect)
+
+    def compose(self, target: pg.Surface, rects: list[pg.Rect]) -> list[pg.Rect]:
+        """
+        Merge the layers into `target`.
+
+        Parameters:
+            target (pygame.Surface): The target surface.
+            rects (list[pygame.Rect]): Areas changed in the current frame.
+
+        Returns:
+            list[pygame.Rect]: Areas of `target` that have been changed.
+        """
+
+        if self.full:
+            changed = [target.get_rect()]
+            for layer in self.layers:
+                target.blit(layer.surface, (0, 0))
+        else:
+            changed = self.previous + rects
+            for rect in changed:
+                for layer in self.layers:
+                    target.blit(layer.surface, rect, area=rect)
+        for layer in self.layers:
+            layer.dirty = False
+        self.previous = rects
+        self.full = False
+        return changed
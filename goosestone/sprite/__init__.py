@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Callable, Optional
+from functools import partial
+from typing import Callable, Optional, cast
 
 import config
 import maps
@@ -14,10 +15,17 @@ class Sprite(ABC):
     animations: list[str]
 
     @abstractmethod
-    def draw(self) -> None:
-        """Draw the sprite to the screen."""
+    def draw(self) -> Optional[pg.Rect]:
+        """Draw the sprite to the screen and return the area it touched."""
         pass
 
+    def bounds(self) -> Optional[pg.Rect]:
+        """
+        Get the area in map pixels the sprite covers on the focused map, or
+        `None` if it is not drawn on the map.
+        """
+        return None
+
     def align_map_pos(self) -> None:
         """
         Align `map_pos` with the current `screen_pos`.
@@ -35,6 +43,7 @@ class TextureSprite(Sprite):
     surface: pg.Surface
     texture: tuple[int, int]
     double_height: bool
+    fixed: bool  # Whether `screen_pos` ignores the camera, e.g. on the HUD
 
     def __init__(
         self,
@@ -49,18 +58,42 @@ class TextureSprite(Sprite):
         self.surface = surface
         self.texture = texture
         self.double_height = double_height
+        self.fixed = False
 
-    def draw(self) -> None:
-        if self.double_height:
-            from render import TILE_HEIGHT
+    def view_pos(self) -> tuple[int, int]:
+        """
+        Get `screen_pos` as seen through the camera.
+        """
+        if self.fixed:
+            return self.screen_pos
+        offset = util.camera.offset
+        return (self.screen_pos[0] - offset[0], self.screen_pos[1] - offset[1])
 
-            render.draw_tile_2h_custom(
-                self.surface,
-                self.texture,
-                (self.screen_pos[0], self.screen_pos[1] - TILE_HEIGHT),
+    def bounds(self) -> Optional[pg.Rect]:
+        if self.fixed:
+            return None
+        x, y = self.screen_pos
+        if self.double_height:
+            return pg.Rect(
+                x, y - render.TILE_HEIGHT, render.TILE_WIDTH, 2 * render.TILE_HEIGHT
             )
-        else:
-            render.draw_tile_custom(self.surface, self.texture, self.screen_pos)
+        return pg.Rect(x, y, render.TILE_WIDTH, render.TILE_HEIGHT)
+
+    def draw(self) -> Optional[pg.Rect]:
+        view_pos = self.view_pos()
+        # Sprites on the map are cut at the edges of the view
+        area = self.surface.get_rect() if self.fixed else util.camera.view()
+        with render.clip(self.surface, area):
+            if self.double_height:
+                from render import TILE_HEIGHT
+
+                return render.draw_tile_2h_custom(
+                    self.surface,
+                    self.texture,
+                    (view_pos[0], view_pos[1] - TILE_HEIGHT),
+                )
+            else:
+                return render.draw_tile_custom(self.surface, self.texture, view_pos)
 
 
 class TimerSprite(TextureSprite):
@@ -83,28 +116,33 @@ class TimerSprite(TextureSprite):
         self.world = world
         self.time = 0
 
-    def draw(self) -> None:
+    def bounds(self) -> Optional[pg.Rect]:
+        return super().bounds() if self.world.focus == (0, 0) else None
+
+    def draw(self) -> Optional[pg.Rect]:
         self.time += 1  # Tick time here
         if self.world.focus == (0, 0):
             btn_rect: pg.Rect = pg.Rect(
-                util.map_to_screen((self.map_pos[0], self.map_pos[1] - 1)),
+                util.map_to_screen((self.map_pos[0], self.map_pos[1] - 1), util.camera),
                 (render.TILE_WIDTH, render.TILE_HEIGHT * 2),
             )
             if btn_rect.collidepoint(pg.mouse.get_pos()):
-                pg.mouse.set_cursor(pg.SYSTEM_CURSOR_HAND)
+                util.set_cursor(pg.SYSTEM_CURSOR_HAND)
                 self.texture = self.hover
-                super().draw()
+                rect = super().draw()
                 hour, minute, second = self.get_time()
-                text: pg.Surface = pg.font.Font(None, 24).render(
+                text: pg.Surface = render.render_label(
                     "Time played: " + f"{hour}h{minute}m{second}s",
-                    config.TEXT_ANTIALIASING,
+                    24,
                     pg.Color(255, 255, 0),
                 )
-                self.surface.blit(text, (8, 8))
+                text_rect = render.blit(self.surface, text, (8, 8))
+                return text_rect if rect == None else rect.union(text_rect)
             else:
-                pg.mouse.set_cursor(pg.SYSTEM_CURSOR_ARROW)
+                util.set_cursor(pg.SYSTEM_CURSOR_ARROW)
                 self.texture = self.normal
-                super().draw()
+                return super().draw()
+        return None
 
     def get_time(self) -> tuple[int, int, int]:
         second = self.time // config.FRAMERATE
@@ -131,42 +169,51 @@ class GemSprite(TextureSprite):
         grid_pos: tuple[int, int],
         world: maps.MapGrid,
     ) -> None:
-        super().__init__(surface, (9, 2 * gem_type + 6), position, True)
+        super().__init__(surface, (9, 2 * (gem_type % 7) + 6), position, True)
         self.gem_type = gem_type
         self.grid_pos = grid_pos
         self.world = world
         self.found = False
 
-    def draw(self) -> None:
+    def bounds(self) -> Optional[pg.Rect]:
+        return super().bounds() if self.world.focus == self.grid_pos else None
+
+    def draw(self) -> Optional[pg.Rect]:
         if self.world.focus == self.grid_pos or self.found:
-            super().draw()
+            return super().draw()
+        return None
 
     def collect_animation(self) -> SpriteMoveTask:
         from sprite.animation import SpriteMoveTask
 
         self.found = True
+        self.screen_pos = self.view_pos()
+        self.fixed = True  # Flies to the HUD below the viewport
+        self.align_map_pos()
         return SpriteMoveTask(
-            self, config.FRAMERATE, (self.gem_type, config.MAP_HEIGHT + 1)
+            self,
+            config.FRAMERATE,
+            (self.gem_type % config.VIEW_WIDTH, config.VIEW_HEIGHT + 1),
         )
 
 
 class CustomSprite(Sprite):
     user_data: dict[str, object]
-    draw_func: Callable[[tuple[int, int], dict[str, object]], None]
+    draw_func: Callable[[tuple[int, int], dict[str, object]], Optional[pg.Rect]]
 
     def __init__(
         self,
         position: tuple[int, int],
         user_data: dict[str, object],
-        draw_func: Callable[[tuple[int, int], dict[str, object]], None],
+        draw_func: Callable[[tuple[int, int], dict[str, object]], Optional[pg.Rect]],
     ) -> None:
         self.map_pos = position
         self.animations = []
         self.user_data = user_data
         self.draw_func = draw_func
 
-    def draw(self) -> None:
-        self.draw_func(self.map_pos, self.user_data)
+    def draw(self) -> Optional[pg.Rect]:
+        return self.draw_func(self.map_pos, self.user_data)
 
 
 class DimensionHelperSprite(Sprite):
@@ -187,30 +234,77 @@ class DimensionHelperSprite(Sprite):
         self.screen_pos = position
         self.surface = surface
 
-    def draw(self) -> None:
+    def draw(self) -> Optional[pg.Rect]:
         if self.visible:
-            text: pg.Surface = pg.font.Font(None, 24).render(
+            text: pg.Surface = render.render_label(
                 f"Dimension: {self.world.focus}",
-                config.TEXT_ANTIALIASING,
+                24,
                 pg.Color(255, 255, 0),
             )
-            self.surface.blit(text, self.screen_pos)
+            return render.blit(self.surface, text, self.screen_pos)
+        return None
 
     def toggle(self) -> None:
         self.visible = not self.visible
 
 
+class HintSprite(Sprite):
+    world: maps.MapGrid
+    surface: pg.Surface
+    grid_pos: Optional[tuple[int, int]]  # Dimension the hint was given in
+    gem: int
+    text: str
+
+    def __init__(
+        self,
+        position: tuple[int, int],  # Screen position
+        surface: pg.Surface,
+        world: maps.MapGrid,
+    ) -> None:
+        super().__init__()
+        self.world = world
+        self.screen_pos = position
+        self.surface = surface
+        self.grid_pos = None
+        self.gem = -1
+        self.text = ""
+
+    def show(self, gem: int, waypoint: tuple[int, int]) -> None:
+        """
+        Point at where to walk to next on the focused map, until the goose
+        leaves it or the gem is collected.
+        """
+
+        self.grid_pos = self.world.focus
+        self.gem = gem
+        if waypoint == self.world.gems[gem][1]:
+            self.text = f"Next gem at {waypoint}"
+        else:
+            self.text = f"Next gem: take portal at {waypoint}"
+
+    def draw(self) -> Optional[pg.Rect]:
+        if (
+            self.grid_pos == self.world.focus
+            and self.world.gems[self.gem] in self.world.gem_index
+        ):
+            text: pg.Surface = render.render_label(self.text, 24, pg.Color(255, 255, 0))
+            return render.blit(self.surface, text, self.screen_pos)
+        return None
+
+
 class Spawner:
     import sprite.animation as ani
 
     sprite_pool: dict[str, Sprite]
     animation_exec: ani.Executor
+    depth: Optional[render.DepthQueue]
 
     def __init__(self) -> None:
         import sprite.animation as ani
 
         self.sprite_pool = {}
         self.animation_exec = ani.Executor()
+        self.depth = None
 
     def add_sprite(self, name: str, sprite: Sprite) -> None:
         self.sprite_pool[name] = sprite
@@ -239,7 +333,53 @@ class Spawner:
     def remove_animation(self, name: str) -> Optional[ani.Task]:
         return self.animation_exec.remove(name)
 
-    def tick(self) -> None:
+    def tick(self, terrain: Optional[maps.Map] = None) -> list[pg.Rect]:
+        """
+        Advance all animations by one frame and draw every sprite. If `terrain`
+        is given, sprites are drawn in map row order, and mountains of `terrain`
+        standing in front of a sprite are drawn again over it.
+
+        Parameters:
+            terrain (Optional[maps.Map]): The focused map.
+
+        Returns:
+            list[pygame.Rect]: Areas of the screen touched by the sprites.
+        """
+
         self.animation_exec.tick()
+        if terrain == None:
+            rects: list[pg.Rect] = []
+            for sprite in self.sprite_pool.values():
+                if (rect := sprite.draw()) != None:
+                    rects.append(rect)
+            return rects
+        rows = util.camera.visible()[1]
+        # One more row below the view, whose mountains reach up into it
+        if self.depth == None or len(self.depth.buckets) != len(rows) + 2:
+            self.depth = render.DepthQueue(len(rows) + 1)
+        self.depth.first = rows.start
+        # Mountains go first so that they cover sprites in the rows above them
+        # but stay behind sprites standing in their own row
+        occluders: set[tuple[int, int]] = set()
+        for sprite in self.sprite_pool.values():
+            if (area := sprite.bounds()) == None:
+                continue
+            for tile in terrain.occluders(area):
+                if (
+                    tile.location[1] > sprite.map_pos[1]
+                    and tile.location not in occluders
+                ):
+                    occluders.add(tile.location)
+                    self.depth.push(
+                        tile.location[1],
+                        partial(
+                            terrain.draw_occluder,
+                            cast(TextureSprite, sprite).surface,
+                            tile,
+                            util.camera,
+                        ),
+                    )
         for sprite in self.sprite_pool.values():
-            sprite.draw()
+            row = sprite.map_pos[1] if sprite.bounds() != None else None
+            self.depth.push(row, sprite.draw)
+        return self.depth.flush()
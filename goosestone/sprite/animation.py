@@ -90,7 +90,7 @@ class MainMoveTask(SpriteMoveTask):
     ) -> None:
         super().__init__(target, duration, stop, start)
         self.world = world
-        if stop[1] >= config.MAP_HEIGHT:
+        if stop[1] >= world.map_height:  # Below the map, on the HUD
             self.duration = 0
 
     def __next__(self) -> None:
@@ -98,7 +98,7 @@ class MainMoveTask(SpriteMoveTask):
         prev_map: tuple[int, int] = self.target.map_pos
         super().__next__()
         cur_x, cur_y = self.target.map_pos
-        tile: maps.Tile = self.world.focus_map().tiles[cur_x][cur_y]
+        tile: maps.Tile = self.world.focus_map().tile((cur_x, cur_y))
         if tile.tile_type == maps.TileType.MOUNTAIN:  # Bouncing back
             self.target.screen_pos = prev_screen
             self.reset()
@@ -108,28 +108,11 @@ class MainMoveTask(SpriteMoveTask):
             # Teleportation START
             portal_info = self.world.focus_map().portals[tile.location]
             if portal_info[1] != -1:  # Normal condition
-                idx = portal_info[0]
-                pair = [v for v in self.world.pairs[idx]]
-                if pair[0] == (self.world.focus, tile.location):
-                    del pair[0]
-                else:
-                    del pair[1]
-                dest_map, dest_tile = pair[0]
+                dest_map, landing = self.world.destination(
+                    self.world.focus, tile.location
+                )
                 self.world.jump(dest_map)
-                x, y = dest_tile
-                available = False
-                for a, b in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]:
-                    if (
-                        self.world.focus_map().tiles[a][b].tile_type
-                        == maps.TileType.GRASSLAND
-                        and 0 <= a <= config.MAP_WIDTH - 1
-                        and 0 <= b <= config.MAP_HEIGHT - 1
-                    ):
-                        self.target.map_pos = (a, b)
-                        available = True
-                        break
-                if not available:
-                    self.target.map_pos = (x, y)
+                self.target.map_pos = landing
                 self.target.align_screen_pos()
             else:  # Bottom-less pit
                 import pygame as pg
@@ -138,14 +121,79 @@ class MainMoveTask(SpriteMoveTask):
             # Teleportation END
             raise StopIteration
         else:  # maps.TileType.GRASSLAND
-            compound = (self.world.focus, self.target.map_pos)
-            if compound in self.world.gems.values():
+            if (idx := self.world.collect(self.target.map_pos)) != None:
                 import pygame as pg
 
-                idx = next(k for k, v in self.world.gems.items() if v == compound)
                 pg.event.post(pg.event.Event(util.GEM_COLLECTED, {"index": idx}))
 
 
+class PathMoveTask(Task):
+    """
+    # PathMoveTask
+
+    Walks a sprite through waypoints, one `MainMoveTask` per straight segment,
+    so every step still collects gems and enters portals. Stops early when a
+    segment ends somewhere else, such as through a portal.
+    """
+
+    world: maps.MapGrid
+    waypoints: list[tuple[int, int]]
+    frames_per_tile: int
+    segment: Optional[MainMoveTask]
+    heading: tuple[int, int]  # End of the current segment
+
+    def __init__(
+        self,
+        target: Sprite,
+        waypoints: list[tuple[int, int]],
+        world: maps.MapGrid,
+        frames_per_tile: int = 2,
+    ) -> None:
+        position = target.map_pos
+        duration = 0
+        for x, y in waypoints:
+            duration += (abs(x - position[0]) + abs(y - position[1])) * frames_per_tile
+            position = (x, y)
+        super().__init__(target, duration)
+        self.world = world
+        self.waypoints = list(waypoints)
+        self.frames_per_tile = frames_per_tile
+        self.segment = None
+        self.heading = target.map_pos
+
+    def __iter__(self) -> Iterator[None]:
+        return self
+
+    def reset(self) -> None:
+        self.progress = 0
+        self.segment = None
+
+    def __next__(self) -> None:
+        while True:
+            if self.segment == None:
+                if len(self.waypoints) == 0:
+                    raise StopIteration
+                x, y = self.heading = self.waypoints.pop(0)
+                tiles = abs(x - self.target.map_pos[0]) + abs(
+                    y - self.target.map_pos[1]
+                )
+                self.segment = MainMoveTask(
+                    self.target,
+                    max(tiles * self.frames_per_tile, 1),
+                    self.heading,
+                    self.world,
+                )
+            focus = self.world.focus
+            try:
+                next(self.segment)
+                self.progress += 1
+                return None
+            except StopIteration:
+                if self.world.focus != focus or self.target.map_pos != self.heading:
+                    self.waypoints.clear()  # Teleported or blocked
+                self.segment = None
+
+
 class TextureSeqTask(Task):
     from sprite import TextureSprite
 
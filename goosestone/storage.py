@@ -0,0 +1,170 @@
+"""
+Binary world files.
+
+A file holds one `maps.MapGrid`, little-endian:
+- The header, see `HEADER`.
+- The world seed as an unsigned integer of `seed_size` bytes.
+- The tiles, one uint8 array of shape `(grid_width, grid_height, 2, map_width,
+  map_height)` with the tile types, then the packed variants of every map.
+- The portal pairs, int32 records of `(portal_id, color, grid_x, grid_y, x, y)`
+  for both ends.
+- The gems, int32 records of `(grid_x, grid_y, x, y)` in gem index order.
+- The portal destination table, int32 records of `(grid_x, grid_y, x, y)` for
+  the portal, then the destination map and landing tile.
+
+Loading maps the file copy-on-write, so the tiles are neither parsed nor read
+until a map is first visited.
+"""
+
+import mmap
+import struct
+from typing import Optional, Union
+
+import maps
+import numpy as np
+
+MAGIC: bytes = b"GSWD"
+VERSION: int = 1
+# magic, version, padding, grid_width, grid_height, map_width, map_height,
+# pair_count, gem_count, destination_count, seed_size
+HEADER: struct.Struct = struct.Struct("<4sHxxIIIIIIII")
+PAIR_FIELDS: int = 10
+GEM_FIELDS: int = 4
+DESTINATION_FIELDS: int = 8
+
+
+def save(world: maps.MapGrid, path: str) -> None:
+    """
+    Write a world to a file. Maps that have not been generated yet are
+    generated first.
+
+    Parameters:
+        world (maps.MapGrid): The world.
+        path (str): The file path.
+
+    Returns:
+        None: Nothing to return.
+    """
+
+    tiles = np.empty(
+        (world.width, world.height, 2, world.map_width, world.map_height), np.uint8
+    )
+    for x in range(world.width):
+        for y in range(world.height):
+            target = world.get_map((x, y))
+            tiles[x, y, 0] = target.types
+            tiles[x, y, 1] = target.variants
+    pairs = np.array(
+        [
+            (portal_id, world.links[a[0]][a[1]][1], *a[0], *a[1], *b[0], *b[1])
+            for portal_id, (a, b) in world.pairs.items()
+        ],
+        "<i4",
+    ).reshape(-1, PAIR_FIELDS)
+    gems = np.array(
+        [(*world.gems[i][0], *world.gems[i][1]) for i in range(len(world.gems))],
+        "<i4",
+    ).reshape(-1, GEM_FIELDS)
+    destinations = np.array(
+        [
+            (*source[0], *source[1], *dest[0], *dest[1])
+            for source, dest in world.destinations.items()
+        ],
+        "<i4",
+    ).reshape(-1, DESTINATION_FIELDS)
+    seed = world.seed.to_bytes(max((world.seed.bit_length() + 7) // 8, 1), "little")
+    with open(path, "wb") as file:
+        file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                world.width,
+                world.height,
+                world.map_width,
+                world.map_height,
+                len(pairs),
+                len(gems),
+                len(destinations),
+                len(seed),
+            )
+        )
+        file.write(seed)
+        for section in (tiles, pairs, gems, destinations):
+            file.write(section.tobytes())
+
+
+def load(
+    path: str,
+    mapped: bool = True,
+    shape: Optional[tuple[int, int, int, int]] = None,
+) -> maps.MapGrid:
+    """
+    Read a world written by `save`.
+
+    Parameters:
+        path (str): The file path.
+        mapped (bool): Map the file copy-on-write instead of reading it whole.
+        shape (Optional[tuple[int, int, int, int]]): The `(grid_width,
+            grid_height, map_width, map_height)` the world must have, or `None`
+            to take any.
+
+    Returns:
+        maps.MapGrid: The world.
+    """
+
+    data: Union[bytes, mmap.mmap]
+    with open(path, "rb") as file:
+        if mapped:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        else:
+            data = file.read()
+    magic, version, *sizes, pair_count, gem_count, dest_count, seed_size = (
+        HEADER.unpack_from(data)
+    )
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a world file")
+    if version != VERSION:
+        raise ValueError(f"{path} has unsupported world file version {version}")
+    if shape != None and tuple(sizes) != shape:
+        raise ValueError(
+            f"{path} holds a {sizes[0]}x{sizes[1]} world of {sizes[2]}x{sizes[3]}"
+            f" maps, expected {shape[0]}x{shape[1]} of {shape[2]}x{shape[3]}"
+        )
+    offset = HEADER.size
+    seed = int.from_bytes(data[offset : offset + seed_size], "little")
+    offset += seed_size
+    grid_width, grid_height, map_width, map_height = sizes
+    layout = (grid_width, grid_height, 2, map_width, map_height)
+    tiles = np.frombuffer(data, np.uint8, int(np.prod(layout)), offset).reshape(layout)
+    offset += tiles.nbytes
+
+    def records(count: int, fields: int) -> list[list[int]]:
+        nonlocal offset
+        found = np.frombuffer(data, "<i4", count * fields, offset)
+        offset += found.nbytes
+        return found.reshape(count, fields).tolist()
+
+    pairs: dict[
+        int,
+        tuple[
+            tuple[tuple[int, int], tuple[int, int]],
+            tuple[tuple[int, int], tuple[int, int]],
+        ],
+    ] = {}
+    colors: dict[int, int] = {}
+    for portal_id, color, ax, ay, alx, aly, bx, by, blx, bly in records(
+        pair_count, PAIR_FIELDS
+    ):
+        pairs[portal_id] = (((ax, ay), (alx, aly)), ((bx, by), (blx, bly)))
+        colors[portal_id] = color
+    gems = {
+        i: ((gx, gy), (x, y))
+        for i, (gx, gy, x, y) in enumerate(records(gem_count, GEM_FIELDS))
+    }
+    destinations = {
+        ((sx, sy), (slx, sly)): ((dx, dy), (dlx, dly))
+        for sx, sy, slx, sly, dx, dy, dlx, dly in records(
+            dest_count, DESTINATION_FIELDS
+        )
+    }
+    return maps.MapGrid.assemble(seed, tiles, pairs, colors, gems, destinations)
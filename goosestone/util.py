@@ -1,18 +1,92 @@
+from typing import Optional, cast
+
 import pygame as pg
+from config import HEADLESS, VIEW_HEIGHT, VIEW_WIDTH
+from render import TILE_HEIGHT, TILE_WIDTH
 
 
-def screen_to_map(screen: tuple[int, int]) -> tuple[int, int]:
-    from render import TILE_HEIGHT, TILE_WIDTH
+class Camera:
+    """
+    # Camera
 
-    return (screen[0] // TILE_WIDTH, screen[1] // TILE_HEIGHT)
+    A viewport into the focused map. `offset` is the top-left corner of the view
+    in map pixels, while `size` is the size of the view in pixels.
+    """
+
+    offset: tuple[int, int]
+    size: tuple[int, int]
+
+    def __init__(self, size: tuple[int, int]) -> None:
+        self.offset = (0, 0)
+        self.size = size
+
+    def follow(self, target: tuple[int, int], bounds: tuple[int, int]) -> bool:
+        """
+        Center the view on a tile without leaving the map.
+
+        Parameters:
+            target (tuple[int, int]): The tile's top-left corner in map pixels.
+            bounds (tuple[int, int]): The map's size in pixels.
+
+        Returns:
+            bool: Whether the view has moved.
+        """
+
+        x = target[0] + (TILE_WIDTH - self.size[0]) // 2
+        y = target[1] + (TILE_HEIGHT - self.size[1]) // 2
+        x = min(max(x, 0), max(bounds[0] - self.size[0], 0))
+        y = min(max(y, 0), max(bounds[1] - self.size[1], 0))
+        moved = (x, y) != self.offset
+        self.offset = (x, y)
+        return moved
 
+    def view(self) -> pg.Rect:
+        """
+        Get the area of the screen the map is seen through, above the HUD.
+        """
+        return pg.Rect((0, 0), self.size)
 
-def map_to_screen(map: tuple[int, int]) -> tuple[int, int]:
-    from render import TILE_HEIGHT, TILE_WIDTH
+    def visible(self, scale: int = 1) -> tuple[range, range]:
+        """
+        Get the columns and rows of `scale` by `scale` tile blocks that intersect
+        the view.
+        """
 
+        width, height = TILE_WIDTH * scale, TILE_HEIGHT * scale
+        x, y = self.offset
+        return (
+            range(x // width, (x + self.size[0] - 1) // width + 1),
+            range(y // height, (y + self.size[1] - 1) // height + 1),
+        )
+
+
+def screen_to_map(
+    screen: tuple[int, int], camera: Optional[Camera] = None
+) -> tuple[int, int]:
+    if camera != None:  # Screen position seen through the viewport
+        screen = (screen[0] + camera.offset[0], screen[1] + camera.offset[1])
+    return (screen[0] // TILE_WIDTH, screen[1] // TILE_HEIGHT)
+
+
+def map_to_screen(
+    map: tuple[int, int], camera: Optional[Camera] = None
+) -> tuple[int, int]:
+    if camera != None:  # Screen position seen through the viewport
+        return (
+            map[0] * TILE_WIDTH - camera.offset[0],
+            map[1] * TILE_HEIGHT - camera.offset[1],
+        )
     return (map[0] * TILE_WIDTH, map[1] * TILE_HEIGHT)
 
 
+def set_cursor(cursor: int) -> None:
+    # No cursor without a window, headless mode only has a hidden one
+    if not HEADLESS and cast(Optional[pg.Surface], pg.display.get_surface()) != None:
+        pg.mouse.set_cursor(cursor)
+
+
+camera: Camera = Camera(map_to_screen((VIEW_WIDTH, VIEW_HEIGHT)))
+
 BOTTOMLESS_PIT: int = pg.event.custom_type()  # Actually an algorithm defect
 GEM_COLLECTED: int = pg.event.custom_type()
 GAME_COMPLETE: int = pg.event.custom_type()